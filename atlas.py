@@ -1,122 +1,257 @@
-import base64
+import hashlib
 import json
-import random
-from io import BytesIO
+import threading
 
 import requests
 from loguru import logger
-from PIL import Image
-
-
-def send_pick_request(x, y):
-    pick_url = "http://lifesciencedb.jp/bp3d/API/pick"
-    pick_payload = {
-        "Part": [
-            {"PartName": "humerus", "PartColor": "0000FF", "PartOpacity": 0.7},
-            {"PartName": "scapula", "PartColor": "0000FF", "PartOpacity": 0.7},
-            {"PartName": "clavicle", "PartColor": "0000FF", "PartOpacity": 0.7},
-            {"PartName": "supraspinatus", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "brachial plexus", "PartColor": "FF0000", "PartOpacity": 0.7},
-            {"PartName": "axillary nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
-            {"PartName": "musculocutaneous nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
-            {"PartName": "dorsal scapular nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
-            {"PartName": "long thoracic nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
-            {"PartName": "suprascapular nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
-            {"PartName": "nerve to subclavius", "PartColor": "FF0000", "PartOpacity": 0.7},
-            {"PartName": "lateral pectoral nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
-            {"PartName": "medial pectoral nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
-            {"PartName": "upper subscapular nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
-            {"PartName": "lower subscapular nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
-            {"PartName": "thoracodorsal nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
-            {"PartName": "pectoralis minor", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "rhomboid major", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "rhomboid minor", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "levator scapulae", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "serratus anterior", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "subscapularis", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "infraspinatus", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "teres minor", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "teres major", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "deltoid", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "biceps brachii", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "coracobrachialis", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "trapezius", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "latissimus dorsi", "PartColor": "FFFF00", "PartOpacity": 0.7},
-            {"PartName": "tendon of long head of biceps brachii", "PartColor": "D2B48C", "PartOpacity": 0.7},
-            {"PartName": "tendon of long head of triceps brachii", "PartColor": "D2B48C", "PartOpacity": 0.7},
-            {"PartName": "axillary fascia", "PartColor": "00FF00", "PartOpacity": 0.7},
-            {"PartName": "pectoral fascia", "PartColor": "00FF00", "PartOpacity": 0.7},
-            {"PartName": "deltoid fascia", "PartColor": "00FF00", "PartOpacity": 0.7},
-            {"PartName": "infraspinous fascia", "PartColor": "00FF00", "PartOpacity": 0.7},
-            {"PartName": "supraspinous fascia", "PartColor": "00FF00", "PartOpacity": 0.7},
-            {"PartName": "subscapular fascia", "PartColor": "00FF00", "PartOpacity": 0.7},
-            {"PartName": "glenohumeral ligaments", "PartColor": "A9A9A9", "PartOpacity": 0.7},
-            {"PartName": "coracohumeral ligament", "PartColor": "A9A9A9", "PartOpacity": 0.7},
-            {"PartName": "transverse humeral ligament", "PartColor": "A9A9A9", "PartOpacity": 0.7},
-            {"PartName": "coracoacromial ligament", "PartColor": "A9A9A9", "PartOpacity": 0.7},
-            {"PartName": "acromioclavicular ligament", "PartColor": "A9A9A9", "PartOpacity": 0.7},
-            {"PartName": "costoclavicular ligament", "PartColor": "A9A9A9", "PartOpacity": 0.7},
-            {"PartName": "glenoid labrum", "PartColor": "808080", "PartOpacity": 0.7},
-        ],
-        "Window": {"ImageWidth": 500, "ImageHeight": 500},
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import count, timer
+from pick_cache import PickCache
+
+ATLAS_BASE_URL = "http://lifesciencedb.jp/bp3d/API"
+PICK_URL = f"{ATLAS_BASE_URL}/pick"
+IMAGE_URL = f"{ATLAS_BASE_URL}/image"
+
+# ! HTTP client of the atlas
+ATLAS_CONNECT_TIMEOUT = 3.05  # Seconds to open the connection
+ATLAS_READ_TIMEOUT = 15.0  # Seconds to wait for the answer
+ATLAS_RETRIES = 3  # Retries on connection errors and transient HTTP statuses
+ATLAS_BACKOFF_FACTOR = 0.5  # Exponential backoff between the retries: 0.5s, 1s, 2s...
+
+# ! Size of the static avatar view, the pick coordinates are in this space
+IMAGE_WIDTH = 500
+IMAGE_HEIGHT = 500
+
+# ! Persistent cache of the pick responses
+PICK_CACHE_PATH = "atlas_cache/pick_cache.sqlite"
+PICK_CACHE_GRID = 2  # Quantization of the pick position in pixels
+PICK_CACHE_TTL = 30 * 24 * 3600  # Lifetime of a cached response in seconds
+PICK_CACHE_MAX_ENTRIES = 100_000
+
+# ! Structures of the shoulder that can be picked on the avatar
+PICK_PARTS = [
+    {"PartName": "humerus", "PartColor": "0000FF", "PartOpacity": 0.7},
+    {"PartName": "scapula", "PartColor": "0000FF", "PartOpacity": 0.7},
+    {"PartName": "clavicle", "PartColor": "0000FF", "PartOpacity": 0.7},
+    {"PartName": "supraspinatus", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "brachial plexus", "PartColor": "FF0000", "PartOpacity": 0.7},
+    {"PartName": "axillary nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
+    {"PartName": "musculocutaneous nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
+    {"PartName": "dorsal scapular nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
+    {"PartName": "long thoracic nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
+    {"PartName": "suprascapular nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
+    {"PartName": "nerve to subclavius", "PartColor": "FF0000", "PartOpacity": 0.7},
+    {"PartName": "lateral pectoral nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
+    {"PartName": "medial pectoral nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
+    {"PartName": "upper subscapular nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
+    {"PartName": "lower subscapular nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
+    {"PartName": "thoracodorsal nerve", "PartColor": "FF0000", "PartOpacity": 0.7},
+    {"PartName": "pectoralis minor", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "rhomboid major", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "rhomboid minor", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "levator scapulae", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "serratus anterior", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "subscapularis", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "infraspinatus", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "teres minor", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "teres major", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "deltoid", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "biceps brachii", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "coracobrachialis", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "trapezius", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "latissimus dorsi", "PartColor": "FFFF00", "PartOpacity": 0.7},
+    {"PartName": "tendon of long head of biceps brachii", "PartColor": "D2B48C", "PartOpacity": 0.7},
+    {"PartName": "tendon of long head of triceps brachii", "PartColor": "D2B48C", "PartOpacity": 0.7},
+    {"PartName": "axillary fascia", "PartColor": "00FF00", "PartOpacity": 0.7},
+    {"PartName": "pectoral fascia", "PartColor": "00FF00", "PartOpacity": 0.7},
+    {"PartName": "deltoid fascia", "PartColor": "00FF00", "PartOpacity": 0.7},
+    {"PartName": "infraspinous fascia", "PartColor": "00FF00", "PartOpacity": 0.7},
+    {"PartName": "supraspinous fascia", "PartColor": "00FF00", "PartOpacity": 0.7},
+    {"PartName": "subscapular fascia", "PartColor": "00FF00", "PartOpacity": 0.7},
+    {"PartName": "glenohumeral ligaments", "PartColor": "A9A9A9", "PartOpacity": 0.7},
+    {"PartName": "coracohumeral ligament", "PartColor": "A9A9A9", "PartOpacity": 0.7},
+    {"PartName": "transverse humeral ligament", "PartColor": "A9A9A9", "PartOpacity": 0.7},
+    {"PartName": "coracoacromial ligament", "PartColor": "A9A9A9", "PartOpacity": 0.7},
+    {"PartName": "acromioclavicular ligament", "PartColor": "A9A9A9", "PartOpacity": 0.7},
+    {"PartName": "costoclavicular ligament", "PartColor": "A9A9A9", "PartOpacity": 0.7},
+    {"PartName": "glenoid labrum", "PartColor": "808080", "PartOpacity": 0.7},
+]
+
+
+def build_pick_payload(x: int, y: int) -> dict:
+    """
+    Payload of a pick request at (x, y) on the static avatar view
+    """
+    return {
+        "Part": PICK_PARTS,
+        "Window": {"ImageWidth": IMAGE_WIDTH, "ImageHeight": IMAGE_HEIGHT},
         "Pick": {"ScreenPosX": x, "ScreenPosY": y},
     }
-    logger.debug("send pick request")
-    logger.debug("📤 Pick Request Payload:", json.dumps(pick_payload, separators=(",", ":")))
-    pick_response = requests.post(pick_url, data=json.dumps(pick_payload), headers={"Content-Type": "application/json"})
-    if pick_response.status_code != 200:
-        logger.error("❌ Pick request failed with status:", pick_response.status_code)
-        logger.error("Response text:", pick_response.text)
-        exit()
-
-    try:
-        result = pick_response.json()
-    except json.JSONDecodeError:
-        logger.error("❌ Failed to decode JSON from response:")
-        logger.error("Raw response:", pick_response.text)
-        exit()
-
-    logger.debug("✅ Pick API Result:")
-    logger.debug(json.dumps(result, indent=2))
-    result = pick_response.json()
-    part_names = list({pin["PinPartName"] for pin in result.get("Pin", [])})
-    '''
-    image_url = "http://lifesciencedb.jp/bp3d/API/image"
-    image_payload = {
-        "Part": [{"PartName": "anatomical entity", "PartColor": "F0D2A0", "PartOpacity": 0.1}],
-        "Window": {"ImageWidth": 500, "ImageHeight": 500},
-    }
-    '''
-    to_return =[]
-    for name in part_names:
-        '''
-        image_payload["Part"].append(
-            {"PartName": name, "PartColor": "".join([random.choice("0123456789ABCDEF") for _ in range(6)]), "PartOpacity": 0.7}
+
+
+def part_names_from_response(result: dict) -> list[str]:
+    """
+    Names of the structures in a pick response
+    """
+    return list({pin["PinPartName"] for pin in result.get("Pin", [])})
+
+
+class AtlasError(Exception):
+    """
+    The atlas could not answer (network error, timeout, bad status or bad response)
+    """
+
+
+class AtlasClient:
+    """
+    HTTP client of the BodyParts3D API
+
+    It keeps a persistent session (keep-alive connection pool), so the requests
+    do not pay a new TCP/DNS setup, uses connect/read timeouts and retries the
+    transient errors with an exponential backoff.
+    """
+
+    # Statuses worth retrying, the pick and image requests are read only
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        base_url: str = ATLAS_BASE_URL,
+        connect_timeout: float = ATLAS_CONNECT_TIMEOUT,
+        read_timeout: float = ATLAS_READ_TIMEOUT,
+        retries: int = ATLAS_RETRIES,
+        backoff_factor: float = ATLAS_BACKOFF_FACTOR,
+        pool_size: int = 8,
+    ):
+        self.base_url: str = base_url.rstrip("/")
+        self.timeout: tuple[float, float] = (connect_timeout, read_timeout)
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False,
         )
-        '''
-        to_return.append(name)
-    '''
-    print("image response ")
-    print("URL:", image_url)
-    print("📤 Pick response Payload:", json.dumps(image_payload, separators=(",", ":")))
-    image_response = requests.post(image_url, data=json.dumps(image_payload), headers={"Content-Type": "application/json"})
-
-    logger.debug("Image response status code:", image_response.status_code)
-    logger.debug("Image response headers:", image_response.headers)
-    logger.debug("Image response content (first 500 chars):", image_response.text[:1000])
-    if image_response.ok:
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+
+        self.session: requests.Session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def pick(self, x: int, y: int) -> list[str]:
+        """
+        Structures at (x, y) on the avatar view
+        :raises AtlasError: if the atlas can not answer
+        """
+        result = self._post("pick", build_pick_payload(x, y))
+        return part_names_from_response(result)
+
+    def image(self, payload: dict) -> str:
+        """
+        Render the parts of the payload
+        :return: the image as a data URI (data:image/png;base64,...)
+        :raises AtlasError: if the atlas can not answer
+        """
+        result = self._post("image", payload)
+        try:
+            return result["data"]
+        except (KeyError, TypeError) as e:
+            raise AtlasError(f"No image in the atlas response: {e}") from e
+
+    def close(self):
+        self.session.close()
+
+    def _post(self, endpoint: str, payload: dict) -> dict:
+        url = f"{self.base_url}/{endpoint}"
+        logger.debug(f"Atlas request to {url}")
         try:
-            response_json = image_response.json()
-            data_uri = response_json["data"]
-
-            base64_str = data_uri.split(",")[1]
-            image_data = base64.b64decode(base64_str)
-            image = Image.open(BytesIO(image_data))
-            image.show()
-
-        except (KeyError, ValueError, json.JSONDecodeError) as e:
-            logger.error("Error extracting image from response:", e)
-    else:
-        logger.error("Image request failed with status:", image_response.status_code)
-    '''
-    return to_return
\ No newline at end of file
+            response = self.session.post(url, data=json.dumps(payload, separators=(",", ":")), timeout=self.timeout)
+        except requests.RequestException as e:
+            raise AtlasError(f"Atlas request to {url} failed: {e}") from e
+
+        if response.status_code != 200:
+            raise AtlasError(f"Atlas request to {url} failed with status {response.status_code}: {response.text[:200]}")
+
+        try:
+            return response.json()
+        except ValueError as e:
+            raise AtlasError(f"Invalid JSON from {url}: {response.text[:200]}") from e
+
+
+_atlas_client: AtlasClient | None = None
+_atlas_client_lock: threading.Lock = threading.Lock()
+
+
+def get_atlas_client() -> AtlasClient:
+    """
+    Shared atlas client, its connection pool is reused by every request
+    """
+    global _atlas_client
+    with _atlas_client_lock:
+        if _atlas_client is None:
+            _atlas_client = AtlasClient()
+        return _atlas_client
+
+
+_pick_cache: PickCache | None = None
+_pick_cache_lock: threading.Lock = threading.Lock()
+
+
+def get_pick_cache() -> PickCache:
+    """
+    Cache of the pick responses, opened on first use
+    """
+    global _pick_cache
+    with _pick_cache_lock:
+        if _pick_cache is None:
+            # Everything but the pick position identifies the request
+            request = {"Part": PICK_PARTS, "Window": {"ImageWidth": IMAGE_WIDTH, "ImageHeight": IMAGE_HEIGHT}}
+            namespace = hashlib.sha1(json.dumps(request, sort_keys=True).encode()).hexdigest()
+            _pick_cache = PickCache(
+                PICK_CACHE_PATH,
+                namespace=namespace,
+                grid=PICK_CACHE_GRID,
+                ttl=PICK_CACHE_TTL,
+                max_entries=PICK_CACHE_MAX_ENTRIES,
+            )
+        return _pick_cache
+
+
+def send_pick_request(x, y, use_cache: bool = True) -> list[str]:
+    """
+    Structures at (x, y) on the avatar view, answered from the persistent cache when possible
+    :param use_cache: set to False to always ask the remote API
+    :raises AtlasError: if the atlas can not answer
+    """
+    with timer("atlas.pick"):
+        if not use_cache:
+            return request_pick(x, y)
+
+        cache = get_pick_cache()
+        cell = cache.cell(x, y)
+        structures = cache.get(cell)
+        if structures is not None:
+            logger.debug(f"Pick cache hit at {(x, y)}")
+            count("atlas.pick_cache_hits")
+            return structures
+
+        count("atlas.pick_cache_misses")
+        structures = request_pick(*cache.cell_center(cell))
+        cache.put(cell, structures)
+        return structures
+
+
+def request_pick(x, y) -> list[str]:
+    """
+    Ask the remote atlas for the structures at (x, y)
+    :raises AtlasError: if the atlas can not answer
+    """
+    with timer("atlas.pick_request"):
+        return get_atlas_client().pick(x, y)
@@ -0,0 +1,434 @@
+"""
+Local (offline) anatomical structures lookup
+
+The static avatar view and the part list in atlas.py never change, so the
+answer of the remote pick API only depends on the (x, y) pick position in the
+500x500 view. The LocalAtlas stores, for every pixel of the view, the set of
+structures under it as a bitset (structures overlap, so a single label per
+pixel is not enough). A query is then a single array read.
+
+The atlas is built offline from a cached dataset of pick responses:
+
+    python atlas_local.py collect --stride 4   # Query the remote API once (resumable)
+    python atlas_local.py build                # Build the atlas from the cache, offline
+    python atlas_local.py benchmark            # Compare the local atlas with the remote API
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from atlas import IMAGE_HEIGHT, IMAGE_WIDTH, PICK_PARTS, AtlasError, send_pick_request
+
+PATH_ATLAS_CACHE = "atlas_cache"
+PICK_RESPONSES_PATH = f"{PATH_ATLAS_CACHE}/pick_responses.jsonl"
+LOCAL_ATLAS_PATH = f"{PATH_ATLAS_CACHE}/local_atlas.npz"
+
+# Bits per word of the bitsets
+WORD_BITS = 64
+
+# ! Pick grid precomputed at startup, over the region reachable by the marker mapping
+PICK_GRID_X_RANGE = (100, 377)  # static_x_start, static_x_end of the mapping
+PICK_GRID_Y_RANGE = (0, IMAGE_HEIGHT - 1)
+PICK_GRID_STRIDE = 8  # Distance between two precomputed positions, in pixels
+PICK_GRID_WORKERS = 4  # Parallel pick requests during the warm-up
+PICK_GRID_MAX_FAILURES = 20  # Consecutive failed requests aborting the warm-up (atlas unreachable)
+
+
+class LocalAtlas:
+    """
+    Structures under each pixel of the avatar view, as bitsets
+
+    `bitsets` has the shape (height, width, words), bit i of a pixel is set when
+    the structure `part_names[i]` is under this pixel.
+    """
+
+    def __init__(self, part_names: list[str], bitsets: np.ndarray):
+        self.part_names: list[str] = part_names
+        self.bitsets: np.ndarray = bitsets
+        # Decoded bitsets, the same few combinations come back over and over
+        self._names_cache: dict[bytes, list[str]] = {}
+
+    @classmethod
+    def load(cls, path: str = LOCAL_ATLAS_PATH) -> "LocalAtlas":
+        with np.load(path) as data:
+            return cls(part_names=[str(name) for name in data["part_names"]], bitsets=data["bitsets"])
+
+    def save(self, path: str = LOCAL_ATLAS_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(path, part_names=np.array(self.part_names), bitsets=self.bitsets)
+
+    @classmethod
+    def from_responses(
+        cls,
+        responses: list[dict],
+        width: int = IMAGE_WIDTH,
+        height: int = IMAGE_HEIGHT,
+    ) -> "LocalAtlas":
+        """
+        Build the atlas from pick responses sampled on a grid
+        Every pixel takes the structures of the nearest sampled position
+        :param responses: list of {"x": int, "y": int, "parts": list[str]}
+        """
+        if not responses:
+            raise ValueError("No pick responses to build the atlas from")
+
+        part_names = sorted({name for response in responses for name in response["parts"]})
+        part_index = {name: i for i, name in enumerate(part_names)}
+        words = max(1, -(-len(part_names) // WORD_BITS))
+
+        bitsets = np.zeros((height, width, words), dtype=np.uint64)
+        sampled = np.zeros((height, width), dtype=bool)
+        for response in responses:
+            x, y = int(response["x"]), int(response["y"])
+            if 0 <= x < width and 0 <= y < height:
+                bitsets[y, x] = _encode(response["parts"], part_index, words)
+                sampled[y, x] = True
+
+        # ! Every pixel takes the structures of its nearest sample
+        bitsets = nearest_fill(bitsets, sampled)
+
+        return cls(part_names=part_names, bitsets=bitsets)
+
+    def query(self, x: int, y: int) -> list[str]:
+        """
+        Structures under the pick position, like send_pick_request
+        :return: list of structure names, empty outside of the view
+        """
+        height, width = self.bitsets.shape[:2]
+        if not (0 <= x < width and 0 <= y < height):
+            return []
+
+        bitset = self.bitsets[int(y), int(x)]
+        key = bitset.tobytes()
+        names = self._names_cache.get(key)
+        if names is None:
+            names = self._decode(bitset)
+            self._names_cache[key] = names
+        return list(names)
+
+    def _decode(self, bitset: np.ndarray) -> list[str]:
+        return _decode(bitset, self.part_names)
+
+
+def _encode(names: list[str], part_index: dict[str, int], words: int) -> np.ndarray:
+    """
+    Bitset of a list of structures
+    """
+    bitset = np.zeros(words, dtype=np.uint64)
+    for name in names:
+        index = part_index[name]
+        bitset[index // WORD_BITS] |= np.uint64(1) << np.uint64(index % WORD_BITS)
+    return bitset
+
+
+def _decode(bitset: np.ndarray, part_names: list[str]) -> list[str]:
+    """
+    List of structures of a bitset
+    """
+    return [name for i, name in enumerate(part_names) if int(bitset[i // WORD_BITS]) >> (i % WORD_BITS) & 1]
+
+
+def nearest_fill(values: np.ndarray, known: np.ndarray) -> np.ndarray:
+    """
+    Give to every unknown cell the value of its nearest known cell
+    A distance transform labels each cell with its closest known cell
+    :param values: (H, W, ...) array
+    :param known: (H, W) boolean mask of the known cells, at least one must be set
+    """
+    ys, xs = np.nonzero(known)
+    _, labels = cv2.distanceTransformWithLabels(
+        (~known).astype(np.uint8),
+        cv2.DIST_L2,
+        5,
+        labelType=cv2.DIST_LABEL_PIXEL,
+    )
+
+    label_to_known = np.zeros(labels.max() + 1, dtype=np.int64)
+    label_to_known[labels[ys, xs]] = np.arange(len(ys))
+    return values[ys, xs][label_to_known[labels]]
+
+
+# ! Default local atlas, loaded once if it was built
+_default_atlas: LocalAtlas | None = None
+_default_atlas_loaded: bool = False
+_default_atlas_lock: threading.Lock = threading.Lock()
+
+
+def get_local_atlas(path: str = LOCAL_ATLAS_PATH) -> LocalAtlas | None:
+    """
+    The local atlas, None if it was not built yet
+    """
+    global _default_atlas, _default_atlas_loaded
+    with _default_atlas_lock:
+        if not _default_atlas_loaded:
+            _default_atlas_loaded = True
+            if os.path.exists(path):
+                _default_atlas = LocalAtlas.load(path)
+                logger.info(f"Local atlas loaded from {path} ({len(_default_atlas.part_names)} structures)")
+            else:
+                logger.warning(f"No local atlas at {path}, the remote atlas will be used")
+        return _default_atlas
+
+
+class PickGrid:
+    """
+    Pick results precomputed on a grid over the reachable region of the avatar view
+
+    The warm-up asks the atlas (through the persistent cache) for every grid position
+    in the background. Once it is done, a lookup returns the structures of the nearest
+    grid position, stored as bitsets in an array. Before that, or outside of the
+    region, the lookup returns None and the caller must use the live request.
+    """
+
+    def __init__(
+        self,
+        x_range: tuple[int, int] = PICK_GRID_X_RANGE,
+        y_range: tuple[int, int] = PICK_GRID_Y_RANGE,
+        stride: int = PICK_GRID_STRIDE,
+    ):
+        self.stride: int = stride
+        self.x_range: tuple[int, int] = x_range
+        self.y_range: tuple[int, int] = y_range
+        self.xs: np.ndarray = np.arange(x_range[0], x_range[1] + 1, stride)
+        self.ys: np.ndarray = np.arange(y_range[0], y_range[1] + 1, stride)
+
+        # Room for twice the requested parts, the atlas can answer with sub-parts names
+        words = max(1, -(-2 * len(PICK_PARTS) // WORD_BITS))
+        self.part_names: list[str] = []
+        self._part_index: dict[str, int] = {}
+        self.bitsets: np.ndarray = np.zeros((len(self.ys), len(self.xs), words), dtype=np.uint64)
+        self.filled: np.ndarray = np.zeros((len(self.ys), len(self.xs)), dtype=bool)
+
+        self.ready: threading.Event = threading.Event()
+        self._stopped: threading.Event = threading.Event()
+        self._thread: threading.Thread = None
+        self._names_cache: dict[bytes, list[str]] = {}
+
+    def start_warm_up(self, workers: int = PICK_GRID_WORKERS) -> "PickGrid":
+        """
+        Start the warm-up in a background thread, does not block
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.warm_up, args=(workers,), name="pick-grid", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def warm_up(self, workers: int = PICK_GRID_WORKERS):
+        """
+        Ask the atlas for every grid position (blocking)
+        """
+        start = time.perf_counter()
+        count_failed = 0
+        count_consecutive_failed = 0
+        logger.info(f"Pick grid warm-up on {self.filled.size} positions")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pick-grid") as executor:
+            futures = {
+                executor.submit(self._pick, int(x), int(y)): (iy, ix)
+                for iy, y in enumerate(self.ys)
+                for ix, x in enumerate(self.xs)
+            }
+            for future in as_completed(futures):
+                try:
+                    parts = future.result()
+                except AtlasError as e:
+                    count_failed += 1
+                    count_consecutive_failed += 1
+                    logger.trace(f"Pick grid position failed: {e}")
+                    # ? Offline, every position would go through all its retries
+                    if count_consecutive_failed >= PICK_GRID_MAX_FAILURES:
+                        logger.warning(f"Pick grid warm-up aborted after {count_consecutive_failed} failed requests: {e}")
+                        self._stopped.set()
+                        for pending in futures:
+                            pending.cancel()
+                        break
+                    continue
+                count_consecutive_failed = 0
+                if parts is not None:
+                    self._set(*futures[future], parts)
+
+        if self._stopped.is_set() or not self.filled.any():
+            logger.warning("Pick grid warm-up stopped, the live atlas will be used")
+            return
+
+        # ! The failed positions take the structures of their nearest computed position
+        self.bitsets = nearest_fill(self.bitsets, self.filled)
+        self.ready.set()
+        logger.info(f"Pick grid ready in {time.perf_counter() - start:.1f}s ({count_failed} failed positions)")
+
+    def lookup(self, x: int, y: int) -> list[str] | None:
+        """
+        Structures at the nearest grid position
+        :return: list of structure names, None if the grid is not ready or (x, y) is outside of its region
+        """
+        if not self.ready.is_set():
+            return None
+        if not (self.x_range[0] <= x <= self.x_range[1] and self.y_range[0] <= y <= self.y_range[1]):
+            return None
+
+        # ? The last grid position can be short of the end of the region, the nearest one is the last one
+        ix = min(round((x - self.xs[0]) / self.stride), len(self.xs) - 1)
+        iy = min(round((y - self.ys[0]) / self.stride), len(self.ys) - 1)
+
+        bitset = self.bitsets[iy, ix]
+        key = bitset.tobytes()
+        names = self._names_cache.get(key)
+        if names is None:
+            names = _decode(bitset, self.part_names)
+            self._names_cache[key] = names
+        return list(names)
+
+    def _pick(self, x: int, y: int) -> list[str] | None:
+        if self._stopped.is_set():
+            return None
+        return send_pick_request(x, y)
+
+    def _set(self, iy: int, ix: int, parts: list[str]):
+        for name in parts:
+            if name not in self._part_index:
+                if len(self.part_names) == self.bitsets.shape[2] * WORD_BITS:
+                    logger.warning(f"Pick grid is full, {name} is ignored")
+                    continue
+                self._part_index[name] = len(self.part_names)
+                self.part_names.append(name)
+
+        known = [name for name in parts if name in self._part_index]
+        self.bitsets[iy, ix] = _encode(known, self._part_index, self.bitsets.shape[2])
+        self.filled[iy, ix] = True
+
+
+_pick_grid: PickGrid | None = None
+
+
+def start_pick_grid() -> PickGrid | None:
+    """
+    Start the background warm-up of the pick grid, unless the local atlas already answers everything
+    """
+    global _pick_grid
+    if _pick_grid is None and get_local_atlas() is None:
+        _pick_grid = PickGrid().start_warm_up()
+    return _pick_grid
+
+
+def stop_pick_grid():
+    if _pick_grid is not None:
+        _pick_grid.stop()
+
+
+def pick_structures(x: int, y: int) -> list[str]:
+    """
+    Structures at (x, y) on the avatar view:
+    - From the local atlas if it was built
+    - Else from the pick grid if it is warmed up and (x, y) is in it
+    - Else from the atlas (persistent cache, then remote API)
+    """
+    local_atlas = get_local_atlas()
+    if local_atlas is not None:
+        return local_atlas.query(x, y)
+
+    if _pick_grid is not None:
+        structures = _pick_grid.lookup(x, y)
+        if structures is not None:
+            return structures
+
+    return send_pick_request(x, y)
+
+
+# ! ---------- Offline dataset ----------
+def load_responses(path: str = PICK_RESPONSES_PATH) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def collect_responses(stride: int, path: str = PICK_RESPONSES_PATH):
+    """
+    Query the remote API on a grid and append the responses to the cache
+    Positions already in the cache are skipped, so it can be resumed
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    done = {(response["x"], response["y"]) for response in load_responses(path)}
+    positions = [
+        (x, y)
+        for y in range(stride // 2, IMAGE_HEIGHT, stride)
+        for x in range(stride // 2, IMAGE_WIDTH, stride)
+        if (x, y) not in done
+    ]
+    logger.info(f"Collecting {len(positions)} pick responses ({len(done)} already cached)")
+
+    with open(path, "a", encoding="utf-8") as f:
+        for i, (x, y) in enumerate(positions):
+            f.write(json.dumps({"x": x, "y": y, "parts": send_pick_request(x, y, use_cache=False)}) + "\n")
+            f.flush()
+            if i % 100 == 0:
+                logger.info(f"{i}/{len(positions)} pick responses collected")
+
+
+def benchmark(local_atlas: LocalAtlas, samples: int, seed: int = 0) -> dict:
+    """
+    Compare the local atlas with the remote API on random positions
+    :return: agreement (exact match rate, mean Jaccard index) and latencies
+    """
+    rng = random.Random(seed)
+    exact, jaccard = 0, 0.0
+    local_time, remote_time = 0.0, 0.0
+
+    for _ in range(samples):
+        x, y = rng.randrange(IMAGE_WIDTH), rng.randrange(IMAGE_HEIGHT)
+
+        start = time.perf_counter()
+        local = set(local_atlas.query(x, y))
+        local_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        remote = set(send_pick_request(x, y, use_cache=False))
+        remote_time += time.perf_counter() - start
+
+        exact += local == remote
+        union = local | remote
+        jaccard += len(local & remote) / len(union) if union else 1.0
+
+    return {
+        "samples": samples,
+        "exact_match_rate": exact / samples,
+        "mean_jaccard": jaccard / samples,
+        "local_ms": 1000 * local_time / samples,
+        "remote_ms": 1000 * remote_time / samples,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local atlas of the avatar view")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    collect_parser = subparsers.add_parser("collect", help="Cache remote pick responses on a grid")
+    collect_parser.add_argument("--stride", type=int, default=4)
+
+    subparsers.add_parser("build", help="Build the local atlas from the cached responses")
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="Compare the local atlas with the remote API")
+    benchmark_parser.add_argument("--samples", type=int, default=200)
+
+    args = parser.parse_args()
+
+    if args.command == "collect":
+        collect_responses(args.stride)
+    elif args.command == "build":
+        atlas = LocalAtlas.from_responses(load_responses())
+        atlas.save()
+        print(f"Local atlas saved at {LOCAL_ATLAS_PATH} ({len(atlas.part_names)} structures)")
+    elif args.command == "benchmark":
+        print(json.dumps(benchmark(LocalAtlas.load(), args.samples), indent=2))
@@ -0,0 +1,115 @@
+"""
+Batched rendering of the picked structures for the report
+
+For each pain, the atlas /API/image endpoint renders the avatar with the picked
+structures highlighted. All the renders are requested in parallel (thread pool
+sharing the atlas client connection pool), so the report waits for the slowest
+render instead of the sum of all of them.
+
+The images come back as base64 data URIs, they are decoded and written in the
+report temporary directory.
+
+The renders are optional in the report: they use short timeouts without retries,
+so an unreachable atlas only delays the report by a few seconds.
+"""
+
+import binascii
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from atlas import ATLAS_BASE_URL, IMAGE_HEIGHT, IMAGE_WIDTH, PICK_PARTS, AtlasClient, AtlasError
+
+# Context of the render: the whole body, almost transparent
+BACKGROUND_PART = {"PartName": "anatomical entity", "PartColor": "F0D2A0", "PartOpacity": 0.1}
+# Color of the structures that are not in the pick part list
+DEFAULT_PART_COLOR = "FF00FF"
+
+# Extension of the written file for each image type of the data URI
+IMAGE_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/gif": "gif"}
+
+# ! HTTP client of the renders, fail fast instead of retrying
+RENDER_CONNECT_TIMEOUT = 2.0  # Seconds to open the connection
+RENDER_READ_TIMEOUT = 8.0  # Seconds to wait for a render
+
+
+def build_image_payload(structures: list[str]) -> dict:
+    """
+    Payload of an image request highlighting the structures, with the colors of the pick part list
+    """
+    colors = {part["PartName"]: part["PartColor"] for part in PICK_PARTS}
+    parts = [BACKGROUND_PART]
+    for name in structures:
+        parts.append({"PartName": name, "PartColor": colors.get(name, DEFAULT_PART_COLOR), "PartOpacity": 0.7})
+
+    return {
+        "Part": parts,
+        "Window": {"ImageWidth": IMAGE_WIDTH, "ImageHeight": IMAGE_HEIGHT},
+    }
+
+
+def write_data_uri(data_uri: str, path_without_extension: str) -> str:
+    """
+    Decode a base64 data URI and write it to a file
+    :return: path of the written file, with the extension of the image type
+    """
+    header_end = data_uri.index(",")
+    header = data_uri[:header_end]  # data:image/png;base64
+    mime_type = header[len("data:") :].split(";")[0]
+    extension = IMAGE_EXTENSIONS.get(mime_type, "png")
+
+    path = f"{path_without_extension}.{extension}"
+    with open(path, "wb") as f:
+        f.write(binascii.a2b_base64(data_uri[header_end + 1 :]))
+    return path
+
+
+def render_structures_images(
+    structures_by_pain: dict[int, list[str]],
+    output_dir: str,
+    client: AtlasClient | None = None,
+    workers: int = 8,
+) -> dict[int, str]:
+    """
+    Render the structures of every pain in parallel
+    :param structures_by_pain: pain index -> structures to highlight, pains without structures are skipped
+    :param output_dir: directory where the images are written (the report temporary directory)
+    :param client: atlas client, by default a client with short timeouts and no retries
+    :return: pain index -> file name of the image, relative to output_dir (failed renders are missing)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    def render(pain_index: int, structures: list[str]) -> str:
+        data_uri = client.image(build_image_payload(structures))
+        path = write_data_uri(data_uri, os.path.join(output_dir, f"atlas_{pain_index + 1}"))
+        return os.path.basename(path)
+
+    jobs = {index: structures for index, structures in structures_by_pain.items() if structures}
+    if not jobs:
+        return {}
+
+    own_client = client is None
+    if own_client:
+        client = AtlasClient(
+            ATLAS_BASE_URL,
+            connect_timeout=RENDER_CONNECT_TIMEOUT,
+            read_timeout=RENDER_READ_TIMEOUT,
+            retries=0,
+            pool_size=workers,
+        )
+
+    images = {}
+    try:
+        with ThreadPoolExecutor(max_workers=min(workers, len(jobs)), thread_name_prefix="atlas-render") as executor:
+            futures = {index: executor.submit(render, index, structures) for index, structures in jobs.items()}
+            for index, future in futures.items():
+                try:
+                    images[index] = future.result()
+                except (AtlasError, ValueError, binascii.Error) as e:
+                    logger.error(f"Atlas render of pain {index + 1} failed: {e}")
+    finally:
+        if own_client:
+            client.close()
+
+    return images
@@ -0,0 +1,108 @@
+"""
+Local stand-in for the BodyParts3D API, to test the atlas client offline
+
+It answers the /API/pick and /API/image endpoints with the same JSON shapes
+as the real API, and can inject latency and transient failures:
+
+    python atlas_stub_server.py --port 8765 --delay 0.2 --fail-rate 0.3
+
+Then point the client to it: AtlasClient(base_url="http://127.0.0.1:8765/API")
+
+It can also be started from Python:
+
+    server, base_url = start_stub_server()
+    ...
+    server.shutdown()
+"""
+
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from atlas import IMAGE_HEIGHT, IMAGE_WIDTH, PICK_PARTS
+
+# 1x1 transparent PNG
+STUB_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+def stub_pick(x: int, y: int) -> list[str]:
+    """
+    Deterministic fake structures: the view is split in vertical bands of parts,
+    and the upper part of the view also has the clavicle
+    """
+    if not (0 <= x < IMAGE_WIDTH and 0 <= y < IMAGE_HEIGHT):
+        return []
+    names = [part["PartName"] for part in PICK_PARTS]
+    parts = {names[x * len(names) // IMAGE_WIDTH]}
+    if y < IMAGE_HEIGHT // 4:
+        parts.add("clavicle")
+    return sorted(parts)
+
+
+class StubAtlasHandler(BaseHTTPRequestHandler):
+    delay: float = 0.0
+    fail_rate: float = 0.0
+    count_requests: int = 0
+
+    def do_POST(self):
+        type(self).count_requests += 1
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        if self.delay:
+            time.sleep(self.delay)
+        if random.random() < self.fail_rate:
+            self._answer(503, {"error": "stub transient failure"})
+            return
+
+        if self.path.rstrip("/").endswith("/API/pick"):
+            pick = payload.get("Pick", {})
+            parts = stub_pick(int(pick.get("ScreenPosX", -1)), int(pick.get("ScreenPosY", -1)))
+            self._answer(200, {"Pin": [{"PinPartName": name} for name in parts]})
+        elif self.path.rstrip("/").endswith("/API/image"):
+            self._answer(200, {"data": "data:image/png;base64," + base64.b64encode(STUB_PNG).decode()})
+        else:
+            self._answer(404, {"error": f"unknown endpoint {self.path}"})
+
+    def _answer(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):  # noqa: A002 signature of BaseHTTPRequestHandler
+        pass
+
+
+def start_stub_server(port: int = 0, delay: float = 0.0, fail_rate: float = 0.0) -> tuple[ThreadingHTTPServer, str]:
+    """
+    Start the stub server in a background thread
+    :param port: port to listen on, 0 picks a free one
+    :return: tuple of (server, base URL to give to the AtlasClient)
+    """
+    handler = type("ConfiguredStubAtlasHandler", (StubAtlasHandler,), {"delay": delay, "fail_rate": fail_rate})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/API"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the BodyParts3D API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="Latency added to each answer, in seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Probability of answering 503")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.port, args.delay, args.fail_rate)
+    print(f"Stub atlas listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,161 @@
+"""
+Mapping from the camera frame to the static avatar view
+
+The atlas is picked on a static 500x500 view of the avatar, the position of the
+palpation device in the camera frame is brought to this view relative to the
+shoulders, with a similarity transform (translation, rotation, uniform scale):
+1. The point is expressed in the shoulder frame of the camera: origin at the
+   middle of the shoulders, X axis from the shoulder on the left of the image to
+   the one on the right, unit = shoulders width. A patient closer to the camera,
+   or leaning, gives the same coordinates.
+2. The calibration (2x3 affine matrix) brings the shoulder frame to the avatar
+   view. The default one puts the shoulders on the shoulders of the avatar
+   (AVATAR_SHOULDER_X_START to AVATAR_SHOULDER_X_END, at AVATAR_SHOULDER_Y).
+
+Every function takes arrays of points, shape (2,) or (N, 2), to map a whole
+trajectory at once:
+
+    avatar = map_points_to_avatar(left_shoulders, right_shoulders, markers)  # (N, 2) float
+
+The calibration of a patient is stored in patient_data[CALIBRATION_KEY] by the
+calibration step of the pain localization: the device is held on each landmark of
+CALIBRATION_LANDMARKS in turn (the shoulders), and fit_calibration corrects the
+offset between the device and the detected shoulders of this patient.
+"""
+
+import numpy as np
+
+# ! Shoulders of the static avatar view, in pick coordinates
+AVATAR_SHOULDER_X_START = 100
+AVATAR_SHOULDER_X_END = 377
+AVATAR_SHOULDER_Y = 100
+
+# Key of the calibration of the patient in patient_data
+CALIBRATION_KEY = "avatar_calibration"
+
+# ! Landmarks of the calibration step: (instruction, position on the avatar view)
+CALIBRATION_LANDMARKS = [
+    ("l'épaule à gauche de l'écran", (AVATAR_SHOULDER_X_START, AVATAR_SHOULDER_Y)),
+    ("l'épaule à droite de l'écran", (AVATAR_SHOULDER_X_END, AVATAR_SHOULDER_Y)),
+]
+
+# ! Shoulder frame -> avatar view, the shoulders of the camera on the shoulders of the avatar
+_AVATAR_SHOULDERS_WIDTH = AVATAR_SHOULDER_X_END - AVATAR_SHOULDER_X_START
+DEFAULT_CALIBRATION = np.array(
+    [
+        [_AVATAR_SHOULDERS_WIDTH, 0.0, (AVATAR_SHOULDER_X_START + AVATAR_SHOULDER_X_END) / 2],
+        [0.0, _AVATAR_SHOULDERS_WIDTH, AVATAR_SHOULDER_Y],
+    ]
+)
+
+# Shoulders closer than this (pixels) are considered as a single point
+_MIN_SHOULDERS_WIDTH = 1e-6
+
+
+def to_shoulder_frame(left_shoulder: np.ndarray, right_shoulder: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    Coordinates of the points in the shoulder frame
+    The shoulders and points broadcast together: one pair of shoulders for all the points, or one pair per point
+    :param left_shoulder: (x, y) in the camera frame, shape (2,) or (N, 2)
+    :param right_shoulder: (x, y) in the camera frame, shape (2,) or (N, 2)
+    :param points: (x, y) in the camera frame, shape (2,) or (N, 2)
+    :return: (u, v) float coordinates, NaN where an input is NaN
+    """
+    left_shoulder = np.asarray(left_shoulder, dtype=np.float64)
+    right_shoulder = np.asarray(right_shoulder, dtype=np.float64)
+    points = np.asarray(points, dtype=np.float64)
+
+    # ? The X axis always goes to the right of the image, whichever keypoint is there (like the former min/max mapping)
+    swap = (left_shoulder[..., 0] > right_shoulder[..., 0])[..., None]
+    start = np.where(swap, right_shoulder, left_shoulder)
+    end = np.where(swap, left_shoulder, right_shoulder)
+
+    axis = end - start
+    length = np.hypot(axis[..., 0], axis[..., 1])[..., None]
+    width = np.maximum(length, _MIN_SHOULDERS_WIDTH)
+    axis_x = np.where(length > _MIN_SHOULDERS_WIDTH, axis / width, (1.0, 0.0))
+    axis_y = np.stack((-axis_x[..., 1], axis_x[..., 0]), axis=-1)  # Y axis goes down, like the image
+
+    offset = (points - (start + end) / 2) / width
+    return np.stack(((offset * axis_x).sum(axis=-1), (offset * axis_y).sum(axis=-1)), axis=-1)
+
+
+def map_points_to_avatar(
+    left_shoulder: np.ndarray,
+    right_shoulder: np.ndarray,
+    points: np.ndarray,
+    calibration: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Positions of the points on the static avatar view
+    :param left_shoulder: (x, y) in the camera frame, shape (2,) or (N, 2)
+    :param right_shoulder: (x, y) in the camera frame, shape (2,) or (N, 2)
+    :param points: (x, y) of the palpation device in the camera frame, shape (2,) or (N, 2)
+    :param calibration: 2x3 affine matrix of the patient, DEFAULT_CALIBRATION if None
+    :return: (x, y) float pick coordinates, NaN where an input is NaN
+    """
+    calibration = DEFAULT_CALIBRATION if calibration is None else np.asarray(calibration, dtype=np.float64)
+    normalized = to_shoulder_frame(left_shoulder, right_shoulder, points)
+    return normalized @ calibration[:, :2].T + calibration[:, 2]
+
+
+def map_to_avatar(
+    left_shoulder: np.ndarray,
+    right_shoulder: np.ndarray,
+    marker: np.ndarray,
+    calibration: np.ndarray | None = None,
+) -> tuple[int, int]:
+    """
+    Position of the marker on the static avatar view
+    :param left_shoulder: (x, y) in the camera frame
+    :param right_shoulder: (x, y) in the camera frame
+    :param marker: (x, y) of the palpation device in the camera frame
+    :param calibration: 2x3 affine matrix of the patient, DEFAULT_CALIBRATION if None
+    :return: tuple of (x, y) pick coordinates on the avatar view
+    """
+    x, y = map_points_to_avatar(left_shoulder, right_shoulder, marker, calibration)
+    return int(x), int(y)
+
+
+def fit_calibration(
+    left_shoulder: np.ndarray,
+    right_shoulder: np.ndarray,
+    points: np.ndarray,
+    avatar_points: np.ndarray,
+) -> np.ndarray:
+    """
+    Least squares calibration of a patient, from the device held on known landmarks
+    With 2 landmarks the calibration is a similarity (scale, rotation, translation), with more an affine transform
+    :param left_shoulder: (x, y) in the camera frame, shape (2,) or (N, 2)
+    :param right_shoulder: (x, y) in the camera frame, shape (2,) or (N, 2)
+    :param points: (N, 2) positions of the device in the camera frame
+    :param avatar_points: (N, 2) positions of the same landmarks on the avatar view
+    :return: 2x3 affine matrix, to store in patient_data[CALIBRATION_KEY]
+    :raises ValueError: if less than 2 landmarks are given, or if they are at the same position
+    """
+    normalized = to_shoulder_frame(left_shoulder, right_shoulder, points).reshape(-1, 2)
+    avatar_points = np.asarray(avatar_points, dtype=np.float64).reshape(-1, 2)
+    if len(normalized) < 2 or len(normalized) != len(avatar_points):
+        raise ValueError(f"At least 2 landmarks are needed, got {len(normalized)} points and {len(avatar_points)} targets")
+    if np.ptp(normalized, axis=0).max() < 1e-3:
+        raise ValueError("The landmarks were all measured at the same position")
+
+    if len(normalized) == 2:
+        # x' = a u - b v + tx, y' = b u + a v + ty
+        u, v = normalized[:, 0], normalized[:, 1]
+        ones, zeros = np.ones_like(u), np.zeros_like(u)
+        design = np.concatenate((np.stack((u, -v, ones, zeros), axis=1), np.stack((v, u, zeros, ones), axis=1)))
+        (a, b, tx, ty), *_ = np.linalg.lstsq(design, avatar_points.T.reshape(-1), rcond=None)
+        return np.array([[a, -b, tx], [b, a, ty]])
+
+    design = np.hstack((normalized, np.ones((len(normalized), 1))))
+    solution, *_ = np.linalg.lstsq(design, avatar_points, rcond=None)
+    return solution.T
+
+
+def patient_calibration(patient_data: dict) -> np.ndarray:
+    """
+    Calibration of the patient, DEFAULT_CALIBRATION if the patient was not calibrated
+    """
+    calibration = patient_data.get(CALIBRATION_KEY)
+    return DEFAULT_CALIBRATION if calibration is None else np.asarray(calibration, dtype=np.float64)
@@ -0,0 +1,291 @@
+"""
+Batch analysis of recorded palpation videos
+
+The videos are cut in shards of consecutive frames, the shards are processed
+in parallel by a pool of processes, each one loading its own copy of the two
+models once. Every frame goes through the same path as the live localization
+(scheduler with tracking, smoothing, mapping on the avatar view, structures).
+
+Each shard is written as its own columnar .npz file in the output directory
+(one array per column, one row per frame), through a temporary file renamed
+when complete. An interrupted run is resumed by running it again: the shards
+already written are skipped.
+
+    python batch_analysis.py run recordings/ --output batch_results --workers 8
+    python batch_analysis.py merge batch_results  # batch_results/results.npz
+
+Columns: video (index in `videos`), frame, time, left_shoulder, right_shoulder,
+marker (x, y in the camera frame, NaN when missing), their confidences, avatar
+(x, y pick position, -1 when not mapped) and structures (bitset over `part_names`).
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import time
+
+import cv2
+import numpy as np
+from loguru import logger
+
+import inference_config
+from atlas import PICK_PARTS, AtlasError, send_pick_request
+from atlas_local import WORD_BITS, get_local_atlas
+from avatar_mapping import map_points_to_avatar
+from benchmark import find_videos
+from capture import read_frame_range, video_properties
+from inference_engine import DetectionResult, InferenceEngine
+from inference_scheduler import InferenceScheduler
+from smoothing import PositionSmoother
+
+BATCH_OUTPUT_DIR = "batch_results"
+SHARD_FRAMES = 1800  # Frames per shard (1 minute at 30 FPS)
+
+# ! Where the structures come from
+STRUCTURES_NONE = "none"
+STRUCTURES_LOCAL = "local"  # Local atlas (atlas_local.py build), offline
+STRUCTURES_REMOTE = "remote"  # Remote atlas through the persistent pick cache
+
+# Structures of the remote atlas, encoded over the part list of the requests
+REMOTE_PART_NAMES = [part["PartName"] for part in PICK_PARTS]
+
+
+def plan_shards(videos: list[str], shard_frames: int = SHARD_FRAMES) -> list[tuple[str, int, int]]:
+    """
+    Cut the videos in shards of consecutive frames
+    :return: list of (video, first frame, end frame (excluded))
+    """
+    shards = []
+    for video in videos:
+        try:
+            total, _ = video_properties(video)
+        except RuntimeError as e:
+            logger.warning(f"Skipping {video}: {e}")
+            continue
+        if total <= 0:
+            logger.warning(f"Skipping {video}: no frame count")
+            continue
+        shards.extend((video, start, min(start + shard_frames, total)) for start in range(0, total, shard_frames))
+    return shards
+
+
+def shard_path(output_dir: str, video: str, start: int, end: int) -> str:
+    """
+    File of a shard, named after the video path so that the same shard is found on resume
+    """
+    video_id = hashlib.sha1(os.path.abspath(video).encode()).hexdigest()[:12]
+    return os.path.join(output_dir, f"shard_{video_id}_{start:09d}_{end:09d}.npz")
+
+
+# ! State of a worker process, loaded once by _init_worker
+_engine: InferenceEngine | None = None
+_structures: str = STRUCTURES_NONE
+
+
+def _init_worker(structures: str, threads: int):
+    global _engine, _structures
+    # ? Each process gets its share of the cores, instead of every process using all of them
+    cv2.setNumThreads(threads)
+    try:
+        import torch  # noqa: PLC0415 - only the PyTorch backend needs it, the ONNX / OpenVINO workers do not load it
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    _structures = structures
+    # The engine is shared by all the shards of the process, it is reset at the start of each shard
+    _engine = InferenceEngine.from_config()
+
+
+def _process_shard(shard: tuple[str, int, int, str]) -> tuple[str, int, float]:
+    """
+    Run the pipeline on the frames of a shard and write its columns
+    :return: tuple of (shard path, number of frames, seconds)
+    """
+    video, start, end, path = shard
+    began = time.perf_counter()
+
+    # ! The tracking and the ROI must not start from the positions of the previous shard (or video)
+    _engine.reset()
+    scheduler = InferenceScheduler(
+        _engine,
+        keyframe_interval=inference_config.keyframe_interval,
+        motion_threshold=inference_config.motion_threshold,
+    )
+    smoother = PositionSmoother(min_confidence=inference_config.min_confidence, max_jump=inference_config.max_jump)
+    local_atlas = get_local_atlas() if _structures == STRUCTURES_LOCAL else None
+    part_names = local_atlas.part_names if local_atlas is not None else REMOTE_PART_NAMES
+    words = (len(part_names) + WORD_BITS - 1) // WORD_BITS
+    part_index = {name: index for index, name in enumerate(part_names)}
+
+    count = end - start
+    columns = {
+        "frame": np.arange(start, end, dtype=np.int64),
+        "time": np.full(count, np.nan, dtype=np.float64),
+        "left_shoulder": np.full((count, 2), np.nan, dtype=np.float32),
+        "right_shoulder": np.full((count, 2), np.nan, dtype=np.float32),
+        "marker": np.full((count, 2), np.nan, dtype=np.float32),
+        "confidence": np.zeros((count, 3), dtype=np.float32),
+        "avatar": np.full((count, 2), -1, dtype=np.int32),
+        "structures": np.zeros((count, words), dtype=np.uint64),
+    }
+
+    _, fps = video_properties(video)
+    row = 0
+    for index, frame in read_frame_range(video, start, end):
+        timestamp = index / fps
+        positions: DetectionResult = smoother.update(scheduler.process(frame), timestamp)
+        columns["time"][row] = timestamp
+        columns["confidence"][row] = (
+            positions.left_shoulder_confidence,
+            positions.right_shoulder_confidence,
+            positions.marker_confidence,
+        )
+        for name in ("left_shoulder", "right_shoulder", "marker"):
+            point = getattr(positions, name)
+            if point is not None:
+                columns[name][row] = point
+        row += 1
+    columns = {name: values[:row] for name, values in columns.items()}
+
+    # ! Map the whole trajectory of the shard at once, on the frames where the shoulders and the marker are known
+    mapped = np.isfinite(columns["left_shoulder"]).all(axis=1)
+    mapped &= np.isfinite(columns["right_shoulder"]).all(axis=1)
+    mapped &= np.isfinite(columns["marker"]).all(axis=1)
+    columns["avatar"][mapped] = map_points_to_avatar(
+        columns["left_shoulder"][mapped],
+        columns["right_shoulder"][mapped],
+        columns["marker"][mapped],
+    ).astype(np.int32)
+    columns["structures"][mapped] = _structures_bitsets(columns["avatar"][mapped], local_atlas, part_index, words)
+
+    # ? Written under a temporary name, a shard file always holds a complete shard
+    temporary_path = f"{path}.tmp.npz"
+    np.savez(temporary_path, part_names=np.array(part_names), **columns)
+    os.replace(temporary_path, path)
+    return path, row, time.perf_counter() - began
+
+
+def _structures_bitsets(positions: np.ndarray, local_atlas, part_index: dict[str, int], words: int) -> np.ndarray:
+    """
+    Structures bitsets at the (N, 2) avatar positions, empty outside the avatar view or on atlas errors
+    """
+    bitsets = np.zeros((len(positions), words), dtype=np.uint64)
+    if _structures == STRUCTURES_LOCAL and local_atlas is not None:
+        height, width = local_atlas.bitsets.shape[:2]
+        x, y = positions[:, 0], positions[:, 1]
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        bitsets[inside] = local_atlas.bitsets[y[inside], x[inside]]
+    elif _structures == STRUCTURES_REMOTE:
+        for row, (x, y) in enumerate(positions.tolist()):
+            try:
+                names = send_pick_request(x, y)
+            except AtlasError as e:
+                logger.warning(f"No structures at {(x, y)}: {e}")
+                continue
+            for index in (part_index[name] for name in names if name in part_index):
+                bitsets[row, index // WORD_BITS] |= np.uint64(1) << np.uint64(index % WORD_BITS)
+    return bitsets
+
+
+def run(
+    sources: list[str],
+    output_dir: str = BATCH_OUTPUT_DIR,
+    workers: int | None = None,
+    shard_frames: int = SHARD_FRAMES,
+    structures: str = STRUCTURES_LOCAL,
+):
+    """
+    Process the videos of the sources, skipping the shards already written
+    """
+    videos = find_videos(sources)
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    if structures == STRUCTURES_LOCAL and get_local_atlas() is None:
+        logger.warning("No local atlas, the structures will not be computed")
+        structures = STRUCTURES_NONE
+
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"videos": videos, "shard_frames": shard_frames, "structures": structures}, f, indent=2)
+
+    shards = [
+        (video, start, end, shard_path(output_dir, video, start, end)) for video, start, end in plan_shards(videos, shard_frames)
+    ]
+    pending = [shard for shard in shards if not os.path.exists(shard[3])]
+    logger.info(f"{len(shards)} shards, {len(shards) - len(pending)} done, {len(pending)} to process on {workers} workers")
+    if not pending:
+        return
+
+    # ? spawn: the models must not be inherited from a forked parent
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    context = mp.get_context("spawn")
+    began, count_frames = time.perf_counter(), 0
+    with context.Pool(workers, initializer=_init_worker, initargs=(structures, threads)) as pool:
+        for index, (path, frames, seconds) in enumerate(pool.imap_unordered(_process_shard, pending), start=1):
+            count_frames += frames
+            elapsed = time.perf_counter() - began
+            logger.info(
+                f"[{index}/{len(pending)}] {os.path.basename(path)}: {frames} frames in {seconds:.1f}s "
+                f"(total {count_frames / elapsed:.1f} frames/s)"
+            )
+
+
+def load_results(output_dir: str = BATCH_OUTPUT_DIR) -> dict[str, np.ndarray]:
+    """
+    Columns of all the shards written so far, sorted by video and frame
+    The `video` column is the index of the video in the `videos` list
+    """
+    with open(os.path.join(output_dir, "manifest.json"), encoding="utf-8") as f:
+        videos = json.load(f)["videos"]
+
+    parts, part_names = [], None
+    for video_index, video in enumerate(videos):
+        prefix = os.path.basename(shard_path(output_dir, video, 0, 0)).rsplit("_", 2)[0]
+        for name in sorted(os.listdir(output_dir)):
+            if not (name.startswith(f"{prefix}_") and name.endswith(".npz")) or ".tmp" in name:
+                continue
+            with np.load(os.path.join(output_dir, name)) as data:
+                columns = {key: data[key] for key in data.files if key != "part_names"}
+                part_names = part_names if part_names is not None else data["part_names"]
+            columns["video"] = np.full(len(columns["frame"]), video_index, dtype=np.int32)
+            parts.append(columns)
+
+    if not parts:
+        return {}
+    results = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+    results["videos"] = np.array(videos)
+    results["part_names"] = part_names
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch analysis of recorded palpation videos")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Process the videos (resumes an interrupted run)")
+    run_parser.add_argument("sources", nargs="+", help="Videos or directories")
+    run_parser.add_argument("--output", default=BATCH_OUTPUT_DIR)
+    run_parser.add_argument("--workers", type=int, default=None, help="Processes, all the cores by default")
+    run_parser.add_argument("--shard-frames", type=int, default=SHARD_FRAMES)
+    run_parser.add_argument(
+        "--structures",
+        choices=(STRUCTURES_NONE, STRUCTURES_LOCAL, STRUCTURES_REMOTE),
+        default=STRUCTURES_LOCAL,
+    )
+
+    merge_parser = subparsers.add_parser("merge", help="Merge the shards in a single results.npz")
+    merge_parser.add_argument("output", nargs="?", default=BATCH_OUTPUT_DIR)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args.sources, args.output, args.workers, args.shard_frames, args.structures)
+    elif args.command == "merge":
+        results = load_results(args.output)
+        path = os.path.join(args.output, "results.npz")
+        np.savez_compressed(path, **results)
+        print(f"{len(results.get('frame', []))} frames merged in {path}")
@@ -0,0 +1,248 @@
+"""
+Headless benchmark of the pain localization pipeline
+
+The recorded videos are replayed through the same path as PainLocalizationLogic,
+without Qt: capture -> inference (scheduler with tracking, both models) ->
+smoothing -> mapping on the avatar view. For each video it reports as JSON:
+- The processed frames per second (and the frames dropped by the capture)
+- The p50/p95/p99 latency of each stage
+- The peak RSS and the CPU utilisation of the process
+
+    python benchmark.py run assets/video.mp4 recordings/ --output baseline.json
+    python benchmark.py compare baseline.json candidate.json --tolerance 0.1
+
+By default every frame of the videos is processed, as fast as possible, and
+--realtime paces them at their native FPS like a camera (late frames are dropped).
+compare exits with 1 when the candidate is slower than the baseline by more than
+the tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from loguru import logger
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+import inference_config
+import metrics
+import video_source
+from avatar_mapping import map_to_avatar
+from capture import VideoCaptureAsync
+from inference_engine import InferenceEngine
+from inference_scheduler import InferenceScheduler
+from smoothing import PositionSmoother
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov")
+
+# Timers of the pipeline reported for each video, in the order of the pipeline
+STAGES = (
+    "capture.wait",
+    "inference.keypoint",
+    "inference.segmentation",
+    "inference.total",
+    "compute.frame",
+    "mapping",
+    "pipeline.frame",
+)
+
+# Number of measures kept per timer, large enough to keep every frame of a video
+BENCHMARK_WINDOW_SIZE = 1_000_000
+
+
+def find_videos(sources: list[str]) -> list[str]:
+    """
+    Video files of the sources, the directories are searched recursively
+    """
+    videos = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, files in os.walk(source):
+                videos.extend(os.path.join(root, name) for name in files if name.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            videos.append(source)
+    return sorted(videos)
+
+
+def peak_rss_mb() -> float | None:
+    """
+    Peak resident memory of the process in MB, None where it is not available (Windows)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ? Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_video(engine: InferenceEngine, path: str, realtime: bool = False, max_frames: int | None = None) -> dict:
+    """
+    Replay one video through the pipeline
+    :param realtime: pace the video at its native FPS, the frames arriving during a computation are dropped
+    :param max_frames: stop after this number of processed frames
+    """
+    metrics.metrics.reset(BENCHMARK_WINDOW_SIZE)
+    engine.reset()  # The ROI must not start from the positions of the previous video
+    scheduler = InferenceScheduler(
+        engine,
+        keyframe_interval=inference_config.keyframe_interval,
+        motion_threshold=inference_config.motion_threshold,
+    )
+    smoother = PositionSmoother(min_confidence=inference_config.min_confidence, max_jump=inference_config.max_jump)
+    count_frames, count_mapped = 0, 0
+
+    # ? Offline, the capture decodes a few frames ahead and waits for the pipeline instead of dropping frames
+    if realtime:
+        capture = VideoCaptureAsync(path, buffer_size=1, loop=False).start()
+    else:
+        capture = VideoCaptureAsync(path, buffer_size=4, loop=False, paced=False, block=True).start()
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        while max_frames is None or count_frames < max_frames:
+            with metrics.timer("capture.wait"):
+                ret, frame = capture.read(timeout=5.0)
+            if not ret:
+                break
+
+            with metrics.timer("pipeline.frame"):
+                with metrics.timer("compute.frame"):
+                    result = scheduler.process(frame)
+                    positions = smoother.update(result, time.monotonic())
+
+                if positions.left_shoulder is not None and positions.right_shoulder is not None and positions.marker is not None:
+                    with metrics.timer("mapping"):
+                        map_to_avatar(positions.left_shoulder, positions.right_shoulder, positions.marker)
+                    count_mapped += 1
+            count_frames += 1
+    finally:
+        capture.release()
+    wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+
+    timers = metrics.metrics.snapshot()["timers"]
+    return {
+        "video": path,
+        "frames": count_frames,
+        "captured_frames": capture.count_frames,
+        "dropped_frames": capture.count_dropped_frames,
+        "mapped_frames": count_mapped,
+        "detect_ratio": scheduler.detect_ratio,
+        "fps": count_frames / wall if wall else 0.0,
+        "wall_s": wall,
+        "cpu_percent": 100 * cpu / wall if wall else 0.0,
+        "latency_ms": {stage: _to_ms(timers[stage]) for stage in STAGES if stage in timers},
+    }
+
+
+def run(sources: list[str], realtime: bool = False, max_frames: int | None = None) -> dict:
+    """
+    Benchmark every video of the sources with the same engine
+    """
+    videos = find_videos(sources)
+    if not videos:
+        raise ValueError(f"No video found in {sources}")
+
+    load_start = time.perf_counter()
+    engine = InferenceEngine.from_config()
+    load_time = time.perf_counter() - load_start
+
+    runs = []
+    for path in videos:
+        logger.info(f"Benchmarking {path}")
+        runs.append(run_video(engine, path, realtime, max_frames))
+    engine.close()
+
+    total_frames = sum(result["frames"] for result in runs)
+    total_wall = sum(result["wall_s"] for result in runs)
+    return {
+        "config": {
+            "imgsz": engine.imgsz,
+            "backend": inference_config.backend,
+            "roi": engine.roi,
+            "keyframe_interval": inference_config.keyframe_interval,
+            "realtime": realtime,
+        },
+        "system": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "model_load_s": load_time,
+        "fps": total_frames / total_wall if total_wall else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "runs": runs,
+    }
+
+
+def compare(baseline: dict, candidate: dict, tolerance: float = 0.1) -> list[str]:
+    """
+    Regressions of the candidate versus the baseline, on the videos benchmarked in both
+    :param tolerance: relative slowdown accepted (0.1 = 10%)
+    :return: one message per regression, empty if none
+    """
+    regressions = []
+
+    def check(name: str, base: float | None, new: float | None, higher_is_better: bool):
+        if not base or new is None:
+            return
+        change = (new - base) / base
+        print(f"{name}: {base:.2f} -> {new:.2f} ({100 * change:+.1f}%)")
+        if (change < -tolerance) if higher_is_better else (change > tolerance):
+            regressions.append(f"{name} regressed by {100 * abs(change):.1f}% ({base:.2f} -> {new:.2f})")
+
+    check("fps", baseline["fps"], candidate["fps"], higher_is_better=True)
+    check("peak_rss_mb", baseline.get("peak_rss_mb"), candidate.get("peak_rss_mb"), higher_is_better=False)
+
+    candidate_runs = {result["video"]: result for result in candidate["runs"]}
+    for base_run in baseline["runs"]:
+        new_run = candidate_runs.get(base_run["video"])
+        if new_run is None:
+            continue
+        video = os.path.basename(base_run["video"])
+        check(f"{video} fps", base_run["fps"], new_run["fps"], higher_is_better=True)
+        for stage, base_latency in base_run["latency_ms"].items():
+            new_latency = new_run["latency_ms"].get(stage)
+            if new_latency is not None:
+                check(f"{video} {stage} p95 ms", base_latency["p95"], new_latency["p95"], higher_is_better=False)
+
+    return regressions
+
+
+def _to_ms(stats: dict) -> dict:
+    return {key: stats[key] if key == "count" else 1000 * stats[key] for key in ("count", "mean", "p50", "p95", "p99", "max")}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless benchmark of the pain localization pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Replay videos through the pipeline")
+    run_parser.add_argument("sources", nargs="*", default=[video_source.video_source], help="Videos or directories")
+    run_parser.add_argument("--realtime", action="store_true", help="Pace the videos at their native FPS")
+    run_parser.add_argument("--max-frames", type=int, default=None, help="Processed frames per video")
+    run_parser.add_argument("--output", help="Write the JSON report to this file")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two reports, exits with 1 on regression")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown accepted")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = json.dumps(run(args.sources, args.realtime, args.max_frames), indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(report)
+        print(report)
+    elif args.command == "compare":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.candidate, encoding="utf-8") as f:
+            candidate = json.load(f)
+        regressions = compare(baseline, candidate, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,240 @@
+"""
+Asynchronous video capture
+
+This is the only place where cv2.VideoCapture is used. A background thread
+grabs the frames from the camera (or the video file from video_source.py)
+and keeps the newest ones in a small ring buffer, so that decoding never
+blocks the consumers.
+
+Video files are paced at their native FPS and looped, to behave like a camera.
+
+Offline processing reads the frames of a range of a video file in order, without
+relying on frame accurate seeking (CAP_PROP_POS_FRAMES lands on the wrong frame
+with many codecs):
+
+    total, fps = video_properties(path)
+    for index, frame in read_frame_range(path, start, end):
+        ...
+"""
+
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+
+import cv2
+from loguru import logger
+
+# FPS used to pace a video file when the container does not give one
+DEFAULT_FILE_FPS = 30.0
+
+# Frames decoded before the start of a range, must be larger than the keyframe interval of the videos
+SEEK_PREROLL_FRAMES = 300
+
+
+def video_properties(path: str) -> tuple[int, float]:
+    """
+    Frame count and FPS of a video file, as given by its container
+    :return: tuple of (frame count, 0 if unknown; FPS, DEFAULT_FILE_FPS if unknown)
+    :raises RuntimeError: if the file can not be opened
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise RuntimeError(f"Could not open video file {path}")
+        return max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))), cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FILE_FPS
+    finally:
+        cap.release()
+
+
+def read_frame_range(path: str, start: int = 0, end: int | None = None) -> Iterator[tuple[int, cv2.Mat]]:
+    """
+    Frames of a video file from start to end (excluded), in order
+    The file is only seeked SEEK_PREROLL_FRAMES before start, the decoder restarts from the keyframe before this
+    position and the frames up to start are grabbed sequentially, so the first frame is the right one
+    :param end: None to read up to the end of the file
+    :return: iterator of (frame index, frame), stops early if the file is shorter
+    :raises RuntimeError: if the file can not be opened
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise RuntimeError(f"Could not open video file {path}")
+
+        position = 0
+        if start > SEEK_PREROLL_FRAMES:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start - SEEK_PREROLL_FRAMES)
+            position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+            if not 0 <= position <= start:
+                # ? The seek overshot the range, decode everything from the beginning
+                logger.warning(f"Inaccurate seek in {path} (frame {position} for {start}), reading from the start")
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                position = 0
+
+        while position < start:
+            if not cap.grab():
+                return
+            position += 1
+
+        while end is None or position < end:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield position, frame
+            position += 1
+    finally:
+        cap.release()
+
+
+class VideoCaptureAsync:
+    """
+    Grab frames in a background thread
+
+    Usage:
+        capture = VideoCaptureAsync(video_source.video_source).start()
+        ret, frame = capture.read(timeout=0.5)
+        capture.release()
+    """
+
+    def __init__(
+        self,
+        src: int | str = 0,
+        buffer_size: int = 1,
+        loop: bool = True,
+        paced: bool = True,
+        block: bool = False,
+    ):
+        """
+        :param src: camera index or path of a video file
+        :param buffer_size: number of frames kept in the ring buffer, the oldest frames are dropped when it is full
+        :param loop: restart a video file from the beginning when it ends
+        :param paced: deliver the frames of a video file at its native FPS, else as fast as they are decoded
+        :param block: wait for the readers when the buffer is full instead of dropping frames (offline processing)
+        """
+        self.src: int | str = src
+        self.buffer_size: int = buffer_size
+        self.loop: bool = loop
+        self.paced: bool = paced
+        self.block: bool = block
+        self.is_file: bool = isinstance(src, str) and not src.isdigit()
+
+        self.cap: cv2.VideoCapture = None
+        self.fps: float = 0.0
+        self.count_frames: int = 0
+        self.count_dropped_frames: int = 0
+
+        self._buffer: deque[cv2.Mat] = deque(maxlen=buffer_size)
+        self._condition: threading.Condition = threading.Condition()
+        self._stopped: threading.Event = threading.Event()
+        self._thread: threading.Thread = None
+
+    def start(self) -> "VideoCaptureAsync":
+        """
+        Open the source and start the grabber thread
+        :raises RuntimeError: if the source can not be opened
+        """
+        if self._thread is not None:
+            return self
+
+        self.cap = cv2.VideoCapture(int(self.src) if isinstance(self.src, str) and self.src.isdigit() else self.src)
+        if not self.cap.isOpened():
+            self.cap.release()
+            raise RuntimeError(f"Could not open video source {self.src}")
+
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+        if self.is_file and self.fps <= 0:
+            self.fps = DEFAULT_FILE_FPS
+        logger.info(f"Capture started on {self.src} ({self.fps:.1f} FPS)")
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._update, name="capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def _update(self):
+        """
+        Grabber loop, runs in the background thread
+        """
+        frame_period = 1 / self.fps if self.is_file and self.paced else 0.0
+        next_deadline = time.monotonic()
+        rewound = False  # No frame was read since the file was rewound
+
+        while not self._stopped.is_set():
+            ret, frame = self.cap.read()
+
+            if not ret:
+                # ? A file without any readable frame would be rewound forever
+                if self.is_file and self.loop and not rewound:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    rewound = True
+                    continue
+                logger.warning(f"No more frames from {self.src}")
+                break
+            rewound = False
+
+            # ! Pace video files at their native FPS
+            if frame_period:
+                next_deadline += frame_period
+                delay = next_deadline - time.monotonic()
+                if delay > 0:
+                    if self._stopped.wait(timeout=delay):
+                        break
+                elif delay < -frame_period:
+                    # We are late by more than a frame, do not try to catch up
+                    next_deadline = time.monotonic()
+
+            with self._condition:
+                if self.block:
+                    self._condition.wait_for(lambda: len(self._buffer) < self.buffer_size or self._stopped.is_set())
+                    if self._stopped.is_set():
+                        break
+                if len(self._buffer) == self.buffer_size:
+                    self.count_dropped_frames += 1
+                self._buffer.append(frame)
+                self.count_frames += 1
+                self._condition.notify_all()
+
+        # Wake up the readers so they do not wait for frames that will never come
+        with self._condition:
+            self._stopped.set()
+            self._condition.notify_all()
+
+    def read(self, timeout: float | None = None) -> tuple[bool, cv2.Mat]:
+        """
+        Get the oldest frame of the buffer, waiting for one if the buffer is empty
+        With a buffer of size 1 this is always the newest frame
+        :param timeout: maximum time to wait in seconds, None to wait forever
+        :return: tuple of (ret, frame) like cv2.VideoCapture.read
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._buffer or self._stopped.is_set(), timeout=timeout)
+            if not self._buffer:
+                return False, None
+            frame = self._buffer.popleft()
+            if self.block:
+                self._condition.notify_all()
+            return True, frame
+
+    def is_running(self) -> bool:
+        return self._thread is not None and not self._stopped.is_set()
+
+    def stop(self):
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def release(self):
+        """Make it behave like cv2.VideoCapture"""
+        self.stop()
+        if self.cap is not None:
+            self.cap.release()
+
+    def __enter__(self) -> "VideoCaptureAsync":
+        return self.start()
+
+    def __exit__(self, exec_type, exc_value, traceback):
+        self.release()
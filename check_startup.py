@@ -0,0 +1,81 @@
+"""
+Import time budget of the application start
+
+The start of the application must stay fast: `main.py` only imports the GUI
+toolkit, the tabs (and their heavy dependencies) are imported on demand by the
+tab registry. This script imports `main` in a fresh interpreter with
+`python -X importtime` and fails if:
+- The cumulative import time of `main` is over the budget
+- One of the heavy modules is imported at start
+
+    python check_startup.py --budget-ms 1500
+
+It exits with 1 when the start regressed, so it can run in CI.
+"""
+
+import argparse
+import subprocess
+import sys
+
+# Cumulative import time of main allowed, in milliseconds
+STARTUP_IMPORT_BUDGET_MS = 1500
+
+# Modules that must only be imported when a step needs them
+HEAVY_MODULES = ("ultralytics", "torch", "typst", "requests", "PIL", "onnxruntime", "openvino")
+
+
+def measure_imports(module: str = "main") -> dict[str, float]:
+    """
+    Import the module in a fresh interpreter
+    :return: imported module -> cumulative import time in milliseconds
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{process.stderr[-2000:]}")
+
+    imports = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        imports[name.strip()] = int(cumulative) / 1000
+    return imports
+
+
+def check_startup(budget_ms: float = STARTUP_IMPORT_BUDGET_MS, module: str = "main") -> list[str]:
+    """
+    :return: the problems found, empty if the start is within the budget
+    """
+    imports = measure_imports(module)
+    problems = []
+
+    total_ms = imports.get(module, 0.0)
+    if total_ms > budget_ms:
+        slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)[1:6]
+        details = ", ".join(f"{name} {time_ms:.0f}ms" for name, time_ms in slowest)
+        problems.append(f"import {module} took {total_ms:.0f}ms (budget {budget_ms:.0f}ms), slowest: {details}")
+
+    for heavy in HEAVY_MODULES:
+        if heavy in imports:
+            problems.append(f"{heavy} is imported at start, import it where it is needed")
+
+    print(f"import {module}: {total_ms:.0f}ms for {len(imports)} modules (budget {budget_ms:.0f}ms)")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time budget of the application start")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_IMPORT_BUDGET_MS)
+    parser.add_argument("--module", default="main")
+    args = parser.parse_args()
+
+    problems = check_startup(args.budget_ms, args.module)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
@@ -1,7 +1,6 @@
 import cv2
 import numpy as np
 from ultralytics import YOLO
-import threading
 import base64
 import json
 import requests
@@ -10,6 +9,8 @@ from PIL import Image
 import random
 from loguru import logger
 
+from capture import VideoCaptureAsync
+
 # ! MODELS
 PATH_MODELS = "models"
 YOLO_KEYPOINT_MODEL = YOLO(f"{PATH_MODELS}/yolo11n-pose.pt")
@@ -21,51 +22,6 @@ PATH_VIDEO_QUENTIN = f"{PATH_ASSETS}/dispositif_quentin.mp4"
 PATH_IMAGE_AVATAR = f"{PATH_ASSETS}/avatar.png"
 
 
-# --- Async Video Capture Class ---
-
-
-class VideoCaptureAsync:
-    def __init__(self, src=0):
-        self.src = src
-        self.cap = cv2.VideoCapture(self.src)
-        self.ret, self.frame = self.cap.read()
-        self.running = False
-        self.read_lock = threading.Lock()
-
-    def start(self):
-        if self.running:
-            return None
-        self.running = True
-        self.thread = threading.Thread(target=self.update, args=())
-        self.thread.start()
-        return self
-
-    def update(self):
-        while self.running:
-            ret, frame = self.cap.read()
-            with self.read_lock:
-                self.ret = ret
-                self.frame = frame
-
-    def read(self):
-        with self.read_lock:
-            frame = self.frame.copy()
-            ret = self.ret
-        return ret, frame
-
-    def stop(self):
-        self.running = False
-        self.thread.join()
-
-    def __exit__(self, exec_type, exc_value, traceback):
-        self.cap.release()
-
-    def release(self):
-        """Make it behave like cv2.VideoCapture"""
-        self.stop()
-        self.cap.release()
-
-
 def send_pick_request(x, y):
     pick_url = "http://lifesciencedb.jp/bp3d/API/pick"
     pick_payload = {
@@ -176,16 +132,16 @@ def send_pick_request(x, y):
 class_names = {0: "background", 1: "manche", 2: "dispositif"}
 
 # --- Start async video capture ---
+# ? Run from the project root with: python -m drafts.camera
 # cam = VideoCaptureAsync(0).start()
 
-cam = cv2.VideoCapture(PATH_VIDEO_QUENTIN)
+cam = VideoCaptureAsync(PATH_VIDEO_QUENTIN).start()
 image_avatar = cv2.imread(PATH_IMAGE_AVATAR)
 while True:
     output_img = image_avatar.copy()
-    ret, frame = cam.read()
+    ret, frame = cam.read(timeout=1)
 
     if not ret:
-        cam.set(cv2.CAP_PROP_POS_FRAMES, 0)
         continue
 
     # Resize frame to fit within 1000x1000 while keeping aspect ratio
@@ -0,0 +1,74 @@
+"""
+Single slot "latest frame" mailbox
+
+The capture loop puts every new frame in the mailbox, the compute thread
+blocks until a frame newer than the last one it processed is available.
+Only the newest frame is kept, stale frames are simply overwritten.
+"""
+
+import threading
+
+import cv2
+
+
+class FrameMailbox:
+    """
+    Handoff of the latest frame between one producer and its consumers
+
+    Each frame gets a monotonically increasing sequence number. The frames
+    put in the mailbox must not be modified afterwards, consumers read them
+    without copying.
+    """
+
+    def __init__(self):
+        self._condition: threading.Condition = threading.Condition()
+        self._frame: cv2.Mat = None
+        self._sequence: int = 0
+        self._closed: bool = False
+
+    @property
+    def sequence(self) -> int:
+        return self._sequence
+
+    def put(self, frame: cv2.Mat) -> int:
+        """
+        Publish a new frame, replacing the previous one
+        :return: sequence number of the frame
+        """
+        with self._condition:
+            self._frame = frame
+            self._sequence += 1
+            self._condition.notify_all()
+            return self._sequence
+
+    def latest(self) -> tuple[int, cv2.Mat]:
+        """
+        Get the latest frame without waiting
+        :return: tuple of (sequence number, frame), frame is None if nothing was published yet
+        """
+        with self._condition:
+            return self._sequence, self._frame
+
+    def wait_newer(self, last_sequence: int, timeout: float | None = None) -> tuple[int, cv2.Mat]:
+        """
+        Block until a frame newer than last_sequence is published
+        :param last_sequence: sequence number of the last frame processed by the caller
+        :param timeout: maximum time to wait in seconds, None to wait forever
+        :return: tuple of (sequence number, frame), frame is None on timeout or if the mailbox is closed
+        """
+        with self._condition:
+            has_new_frame = self._condition.wait_for(
+                lambda: self._sequence > last_sequence or self._closed,
+                timeout=timeout,
+            )
+            if not has_new_frame or self._sequence <= last_sequence:
+                return last_sequence, None
+            return self._sequence, self._frame
+
+    def close(self):
+        """
+        Wake up every waiting consumer, used on shutdown
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
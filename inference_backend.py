@@ -0,0 +1,129 @@
+"""
+Inference backends of the YOLO models
+
+The models are trained and shipped as PyTorch `.pt` files, but on the CPU
+only stations the exported graphs are much faster and lighter:
+- "pytorch": the `.pt` file as is
+- "onnx": ONNX Runtime on CPU (`models/best.onnx`)
+- "openvino": Intel OpenVINO (`models/best_openvino_model/`)
+- "onnx_int8" and "openvino_int8": the same graphs quantized to INT8, they are
+  built by `quantization.py` (static calibration on frames of the video)
+
+The export is done once with ultralytics and cached next to the `.pt` file,
+it is redone when the `.pt` file is newer than the export. The exported
+models are loaded through ultralytics too, so the results (and everything
+parsed from them) are the same whatever the backend.
+
+ultralytics (and torch) are only imported when a model is loaded, they take
+seconds to import.
+"""
+
+import importlib.util
+import os
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
+PYTORCH = "pytorch"
+ONNX = "onnx"
+OPENVINO = "openvino"
+ONNX_INT8 = "onnx_int8"
+OPENVINO_INT8 = "openvino_int8"
+
+# Backend -> (suffix of the exported model next to the .pt file, python packages needed to run it)
+BACKENDS = {
+    PYTORCH: ("", ()),
+    ONNX: (".onnx", ("onnx", "onnxruntime")),
+    OPENVINO: ("_openvino_model", ("openvino",)),
+    ONNX_INT8: ("_int8.onnx", ("onnx", "onnxruntime")),
+    OPENVINO_INT8: ("_int8_openvino_model", ("openvino",)),
+}
+
+# Quantized backend -> backend of the FP32 graph it is built from
+QUANTIZED_BACKENDS = {ONNX_INT8: ONNX, OPENVINO_INT8: OPENVINO}
+# Quantized backend -> python packages needed to build it (quantization.py), not to run it
+QUANTIZATION_PACKAGES = {ONNX_INT8: ("onnx", "onnxruntime"), OPENVINO_INT8: ("openvino", "nncf")}
+
+
+def exported_model_path(model_path: str, backend: str) -> str:
+    """
+    Path of the model exported for the backend, next to the .pt file
+    """
+    suffix, _ = BACKENDS[backend]
+    if not suffix:
+        return model_path
+    return f"{os.path.splitext(model_path)[0]}{suffix}"
+
+
+def is_backend_available(backend: str) -> bool:
+    """
+    Whether the python packages of the backend are installed
+    """
+    _, packages = BACKENDS[backend]
+    return _are_installed(packages)
+
+
+def is_quantization_available(backend: str) -> bool:
+    """
+    Whether the python packages needed to build the quantized models of the backend are installed
+    """
+    return _are_installed(QUANTIZATION_PACKAGES[backend])
+
+
+def _are_installed(packages: tuple[str, ...]) -> bool:
+    return all(importlib.util.find_spec(package) is not None for package in packages)
+
+
+def export_model(model_path: str, backend: str, imgsz: int) -> str:
+    """
+    Export the .pt model for the backend, unless an up to date export is already cached
+    The export has dynamic input shapes, so the same graph serves every input size
+    :param imgsz: input size used to trace the graph
+    :return: path of the exported model
+    """
+    path = exported_model_path(model_path, backend)
+    if backend == PYTORCH:
+        return path
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(model_path):
+        return path
+    if backend in QUANTIZED_BACKENDS:
+        # ? The calibration needs the video frames, it is not done on the fly
+        raise FileNotFoundError(f"{path} is missing or outdated, build it with: python quantization.py quantize")
+
+    # ? ultralytics (and torch) take seconds to import, only once a model is actually exported or loaded
+    from ultralytics import YOLO  # noqa: PLC0415
+
+    logger.info(f"Exporting {model_path} for {backend}, this is only done once")
+    exported = YOLO(model_path).export(format=backend, imgsz=imgsz, dynamic=True)
+    return str(exported)
+
+
+def load_model(model_path: str, task: str, backend: str = PYTORCH, imgsz: int = 640) -> "YOLO":
+    """
+    Load a YOLO model with the backend, exporting it first if needed
+    Falls back to PyTorch if the backend is unknown, not installed or if the export fails
+    :param model_path: path of the .pt model
+    :param task: ultralytics task of the model ("pose", "segment"), the exported graphs do not always carry it
+    :param backend: one of BACKENDS
+    :param imgsz: input size used to trace the exported graph
+    """
+    if backend not in BACKENDS:
+        logger.warning(f"Unknown inference backend {backend!r}, using {PYTORCH}")
+        backend = PYTORCH
+    elif not is_backend_available(backend):
+        logger.warning(f"Inference backend {backend!r} is not installed, using {PYTORCH}")
+        backend = PYTORCH
+
+    try:
+        path = export_model(model_path, backend, imgsz)
+    except Exception:  # ? Any export error must leave the application usable
+        logger.exception(f"Export of {model_path} for {backend} failed, using {PYTORCH}")
+        path, backend = model_path, PYTORCH
+
+    from ultralytics import YOLO  # noqa: PLC0415 - imported on load, like in export_model
+
+    logger.info(f"Loading {path} ({backend})")
+    return YOLO(path, task=task)
@@ -0,0 +1,25 @@
+# ! Input size of the models, the camera frame is resized once to this size (longest side) for both models
+# ? Lower it (416, 320) on low-end kiosks, the positions are still returned in camera frame coordinates
+imgsz = 640  # Rounded to a multiple of 32
+
+# ! Backend running the models: "pytorch", "onnx" (ONNX Runtime CPU), "openvino", "onnx_int8" or "openvino_int8"
+# ? The model is exported once and cached next to the .pt file, falls back to "pytorch" if the backend is not installed
+backend = "pytorch"
+
+# ! Run the models in a separate process, the frames are shared through a shared memory ring (inference_process.py)
+# ? Keeps the GUI and the capture responsive on multi-core machines, costs one frame copy and a second Python process
+inference_process = False
+
+# ! Inference scheduling, trade accuracy for CPU budget
+keyframe_interval = 5  # Run the full detection every N frames (1 = detect on every frame)
+motion_threshold = 6.0  # Mean absolute difference between frames (0-255) forcing a full detection
+
+# ! Segmentation of the device on a crop around the shoulders
+roi_enabled = True  # Run the device segmentation on a padded box around the shoulders instead of the full frame
+roi_imgsz = 320  # Input size of the segmentation model on the crop
+roi_padding = 0.75  # Padding around the shoulders (and last marker), relative to the shoulders width
+marker_subpixel = True  # Keep the marker at subpixel precision until it is scaled back to the camera frame
+
+# ! Temporal smoothing of the positions
+min_confidence = 0.5  # Detections with a lower confidence are ignored
+max_jump = 0.5  # Largest accepted move between two frames, relative to the shoulders width
@@ -0,0 +1,428 @@
+"""
+Inference engine for the pain localization
+
+It runs the two YOLO models used to follow the patient:
+- The pose model (shoulders keypoints)
+- The segmentation model (palpation device)
+
+Both models are submitted concurrently on the same frame, and the frame
+is resized only once (shared by both models) before being handed to them.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+from loguru import logger
+
+import inference_config
+from inference_backend import PYTORCH, load_model
+from metrics import observe, timer
+
+PATH_MODELS = "models"
+KEYPOINT_MODEL_PATH = f"{PATH_MODELS}/yolo11n-pose.pt"
+SEGMENTATION_MODEL_PATH = f"{PATH_MODELS}/best.pt"
+
+# COCO keypoints indexes of the shoulders
+LEFT_SHOULDER_INDEX = 5
+RIGHT_SHOULDER_INDEX = 6
+
+# Class of the palpation device in the segmentation model
+DEVICE_CLASS_ID = 2
+
+# Largest stride of the YOLO models, the input sizes must be a multiple of it
+MODEL_STRIDE = 32
+
+
+class DetectionResult(NamedTuple):
+    """
+    Result of one inference pass, coordinates are in the raw frame space
+    Any element can be None if it was not detected
+    """
+
+    left_shoulder: np.ndarray | None
+    right_shoulder: np.ndarray | None
+    marker: np.ndarray | None
+    # Confidence (0-1) given by the models for each element, 0 if not detected
+    left_shoulder_confidence: float = 0.0
+    right_shoulder_confidence: float = 0.0
+    marker_confidence: float = 0.0
+
+
+class InferenceEngine:
+    """
+    Runs the pose and the segmentation models on the same frame
+
+    The frame is resized once so that its longest side matches the model
+    input size, both models then run concurrently on this shared frame and
+    the coordinates are scaled back to the raw frame.
+
+    In ROI mode, the segmentation model only runs on a padded box around the
+    shoulders (and the last marker) cropped from the raw frame, at a smaller
+    input size. The full frame is used when no shoulders are known yet or
+    when the device is not found in the ROI.
+    """
+
+    def __init__(
+        self,
+        keypoint_model_path: str = KEYPOINT_MODEL_PATH,
+        segmentation_model_path: str = SEGMENTATION_MODEL_PATH,
+        imgsz: int = 640,
+        roi: bool = False,
+        roi_imgsz: int = 320,
+        roi_padding: float = 0.75,
+        subpixel: bool = True,
+        backend: str = PYTORCH,
+    ):
+        """
+        :param imgsz: input size of the models on the full frame
+        :param roi: run the segmentation model on a crop around the shoulders
+        :param roi_imgsz: input size of the segmentation model on the crop
+        :param roi_padding: padding around the shoulders, relative to the shoulders width
+        :param subpixel: keep the marker at subpixel precision until it is scaled back to the raw frame
+        :param backend: inference backend of the models, one of inference_backend.BACKENDS
+        """
+        logger.info("Loading inference models")
+        self.imgsz: int = model_input_size(imgsz)
+        self.roi: bool = roi
+        self.roi_imgsz: int = model_input_size(roi_imgsz)
+        self.roi_padding: float = roi_padding
+        self.subpixel: bool = subpixel
+        self.yolo_keypoint_model = load_model(keypoint_model_path, "pose", backend, self.imgsz)
+        self.yolo_segmentation_model = load_model(segmentation_model_path, "segment", backend, self.imgsz)
+
+        # One worker per model, so both forward passes run at the same time
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="inference")
+
+        # Last known positions, used to place the ROI
+        self.last_left_shoulder: np.ndarray = None
+        self.last_right_shoulder: np.ndarray = None
+        # ! Marker of the previous search only (the previous keyframe), cleared when it is not found
+        self.last_marker: np.ndarray = None
+
+    @classmethod
+    def from_config(cls, **overrides) -> "InferenceEngine":
+        """
+        Engine configured by inference_config.py
+        :param overrides: arguments replacing the configured ones
+        """
+        arguments = {
+            "imgsz": inference_config.imgsz,
+            "backend": inference_config.backend,
+            "roi": inference_config.roi_enabled,
+            "roi_imgsz": inference_config.roi_imgsz,
+            "roi_padding": inference_config.roi_padding,
+            "subpixel": inference_config.marker_subpixel,
+        }
+        return cls(**(arguments | overrides))
+
+    def preprocess(self, raw_frame: cv2.Mat, imgsz: int | None = None) -> tuple[cv2.Mat, float]:
+        """
+        Resize the frame once for both models
+        :param raw_frame: frame from the camera
+        :param imgsz: size of the longest side, defaults to the model input size
+        :return: tuple of (resized frame, scale from raw frame to resized frame)
+        """
+        height, width = raw_frame.shape[:2]
+        scale = (imgsz or self.imgsz) / max(height, width)
+        if scale >= 1:
+            return raw_frame, 1.0
+
+        new_size = (round(width * scale), round(height * scale))
+        return cv2.resize(raw_frame, new_size, interpolation=cv2.INTER_LINEAR), scale
+
+    def infer(self, raw_frame: cv2.Mat) -> DetectionResult:
+        """
+        Detect the shoulders and the marker on the same frame in a single pass
+        :param raw_frame: frame from the camera
+        :return: DetectionResult in raw frame coordinates
+        """
+        start = time.perf_counter()
+        frame, scale = self.preprocess(raw_frame)
+
+        # ? Both models run at the same time, so the ROI uses the shoulders of the previous frame
+        keypoints_future = self.executor.submit(self._run_keypoint_model, frame)
+        marker_future = self.executor.submit(
+            self._find_marker, raw_frame, frame, scale, self.last_left_shoulder, self.last_right_shoulder
+        )
+
+        left_shoulder, right_shoulder, shoulders_confidence = self._parse_shoulders(keypoints_future.result())
+        left_shoulder, right_shoulder = _to_raw(left_shoulder, scale), _to_raw(right_shoulder, scale)
+        marker, marker_confidence = marker_future.result()
+
+        self._update_last_positions(left_shoulder, right_shoulder, marker)
+        observe("inference.total", time.perf_counter() - start)
+        return DetectionResult(
+            left_shoulder=_to_pixel(left_shoulder),
+            right_shoulder=_to_pixel(right_shoulder),
+            marker=_to_pixel(marker),
+            left_shoulder_confidence=shoulders_confidence[0],
+            right_shoulder_confidence=shoulders_confidence[1],
+            marker_confidence=marker_confidence,
+        )
+
+    def detect_shoulders(self, raw_frame: cv2.Mat) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Detect only the shoulders on the frame
+        :return: tuple of (left shoulder, right shoulder), (None, None) if not found
+        """
+        frame, scale = self.preprocess(raw_frame)
+        left_shoulder, right_shoulder, _ = self._parse_shoulders(self._run_keypoint_model(frame))
+        return _to_pixel(_to_raw(left_shoulder, scale)), _to_pixel(_to_raw(right_shoulder, scale))
+
+    def detect_marker(
+        self,
+        raw_frame: cv2.Mat,
+        left_shoulder: np.ndarray | None = None,
+        right_shoulder: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """
+        Detect only the marker on the frame
+        :param left_shoulder: left shoulder on this frame, used for the ROI (last known one if None)
+        :param right_shoulder: right shoulder on this frame, used for the ROI (last known one if None)
+        :return: marker coordinates, None if not found
+        """
+        if left_shoulder is None or right_shoulder is None:
+            left_shoulder, right_shoulder = self.last_left_shoulder, self.last_right_shoulder
+
+        frame, scale = self.preprocess(raw_frame)
+        marker, _ = self._find_marker(raw_frame, frame, scale, left_shoulder, right_shoulder)
+        self.last_marker = marker
+        return _to_pixel(marker)
+
+    def marker_roi(
+        self,
+        frame_shape: tuple[int, int],
+        left_shoulder: np.ndarray | None,
+        right_shoulder: np.ndarray | None,
+    ) -> tuple[int, int, int, int] | None:
+        """
+        Box where the device is searched: the shoulders (and the marker of the previous search,
+        if it was found) padded by roi_padding times the shoulders width, clipped to the frame
+        :param frame_shape: (height, width) of the raw frame
+        :return: tuple of (x0, y0, x1, y1), None if the shoulders are unknown
+        """
+        if left_shoulder is None or right_shoulder is None:
+            return None
+
+        points = [left_shoulder, right_shoulder]
+        if self.last_marker is not None:
+            points.append(self.last_marker)
+        points = np.asarray(points, dtype=np.float64)
+
+        shoulders_width = abs(float(left_shoulder[0]) - float(right_shoulder[0]))
+        padding = max(self.roi_padding * shoulders_width, 32.0)
+
+        frame_h, frame_w = frame_shape
+        x0, y0 = np.maximum(points.min(axis=0) - padding, 0).astype(int)
+        x1, y1 = np.minimum(points.max(axis=0) + padding, (frame_w, frame_h)).astype(int)
+        if x1 - x0 < 32 or y1 - y0 < 32:
+            return None
+        return int(x0), int(y0), int(x1), int(y1)
+
+    def reset(self):
+        """
+        Forget the last known positions, before the frames of another video (or another part of it)
+        """
+        self.last_left_shoulder = None
+        self.last_right_shoulder = None
+        self.last_marker = None
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _update_last_positions(self, left_shoulder, right_shoulder, marker):
+        if left_shoulder is not None and right_shoulder is not None:
+            self.last_left_shoulder = left_shoulder
+            self.last_right_shoulder = right_shoulder
+        # ? A marker of an older keyframe would stretch the ROI to where the device no longer is
+        self.last_marker = marker
+
+    def _run_keypoint_model(self, frame: cv2.Mat):
+        # ? Without imgsz, ultralytics would letterbox the already resized frame back up to 640
+        with timer("inference.keypoint"):
+            return self.yolo_keypoint_model(source=frame, imgsz=self.imgsz, verbose=False)
+
+    def _run_segmentation_model(self, frame: cv2.Mat, imgsz: int | None = None):
+        with timer("inference.segmentation"):
+            return self.yolo_segmentation_model(source=frame, imgsz=imgsz or self.imgsz, verbose=False)
+
+    def _find_marker(
+        self,
+        raw_frame: cv2.Mat,
+        frame: cv2.Mat,
+        scale: float,
+        left_shoulder: np.ndarray | None,
+        right_shoulder: np.ndarray | None,
+    ) -> tuple[np.ndarray | None, float]:
+        """
+        Find the marker in the ROI if enabled, else (or if not found) in the full frame
+        :param raw_frame: frame from the camera
+        :param frame: resized frame shared with the pose model
+        :param scale: scale from the raw frame to the resized frame
+        :return: tuple of (marker in raw frame coordinates (float) or None if not found, confidence)
+        """
+        roi = self.marker_roi(raw_frame.shape[:2], left_shoulder, right_shoulder) if self.roi else None
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            crop, crop_scale = self.preprocess(raw_frame[y0:y1, x0:x1], self.roi_imgsz)
+            marker, confidence = self._parse_marker(self._run_segmentation_model(crop, self.roi_imgsz), crop.shape[:2])
+            if marker is not None:
+                return _to_raw(marker, crop_scale) + (x0, y0), confidence
+
+        marker, confidence = self._parse_marker(self._run_segmentation_model(frame), frame.shape[:2])
+        return _to_raw(marker, scale), confidence
+
+    def _parse_shoulders(self, keypoints_results) -> tuple[np.ndarray, np.ndarray, tuple[float, float]]:
+        """
+        Extract the shoulders of the first person from the pose results
+        :return: tuple of (left shoulder, right shoulder, (left confidence, right confidence))
+        """
+        if not keypoints_results:
+            logger.warning("No keypoints detected.")
+            return None, None, (0.0, 0.0)
+
+        left_shoulder, right_shoulder, confidences = None, None, (0.0, 0.0)
+        for result in keypoints_results:
+            if not hasattr(result, "keypoints"):
+                logger.warning("No keypoints found in the results.")
+                return None, None, (0.0, 0.0)
+
+            keypoints = result.keypoints
+            if keypoints is not None and keypoints.shape[0] > 0:
+                keypoints_numpy = keypoints.data.cpu().numpy()[0]
+                left_shoulder = keypoints_numpy[LEFT_SHOULDER_INDEX][:2]
+                right_shoulder = keypoints_numpy[RIGHT_SHOULDER_INDEX][:2]
+                # ? (x, y) only keypoints have no confidence, trust them
+                if keypoints_numpy.shape[1] > 2:
+                    confidences = (float(keypoints_numpy[LEFT_SHOULDER_INDEX][2]), float(keypoints_numpy[RIGHT_SHOULDER_INDEX][2]))
+                else:
+                    confidences = (1.0, 1.0)
+
+        return left_shoulder, right_shoulder, confidences
+
+    def _parse_marker(self, seg_results, frame_shape: tuple[int, int]) -> tuple[np.ndarray, float]:
+        """
+        Extract the marker position (median of the device mask) from the segmentation results
+        :param frame_shape: (height, width) of the frame given to the model
+        :return: tuple of (marker or None, confidence of the device detection)
+        """
+        if not seg_results:
+            logger.warning("No segmentation results found.")
+            return None, 0.0
+
+        device_location, device_confidence = None, 0.0
+
+        for result in seg_results:
+            masks = getattr(result, "masks", None)
+            boxes = getattr(result, "boxes", None)
+
+            if masks is None or masks.data is None or boxes is None:
+                return None, 0.0
+
+            # ! Only the most confident device detection is reduced to a point
+            classes = boxes.cls.cpu().numpy()
+            confidences = np.where(classes == DEVICE_CLASS_ID, boxes.conf.cpu().numpy(), -1.0)
+            if confidences.size == 0 or confidences.max() < 0:
+                continue
+
+            mask = masks.data[int(confidences.argmax())]
+            point = mask_median_point(mask, subpixel=self.subpixel)
+            if point is None:
+                continue
+
+            # ? The mask has the letterboxed model input size, bring it back to the frame
+            device_location = unletterbox_point(point, mask.shape[-2:], frame_shape)
+            device_confidence = float(confidences.max())
+
+        return device_location, device_confidence
+
+
+def model_input_size(imgsz: int) -> int:
+    """
+    Closest valid input size of the models (multiple of the stride, at least one stride)
+    """
+    return max(MODEL_STRIDE, round(imgsz / MODEL_STRIDE) * MODEL_STRIDE)
+
+
+def unletterbox_point(point: np.ndarray, input_shape: tuple[int, int], frame_shape: tuple[int, int]) -> np.ndarray:
+    """
+    Bring a point from the letterboxed model input back to the frame given to the model
+    The frame was resized with its aspect ratio kept, then padded evenly on both sides (same rounding as ultralytics)
+    :param point: (x, y) pixel coordinates in the model input
+    :param input_shape: (height, width) of the model input (shape of the masks)
+    :param frame_shape: (height, width) of the frame given to the model
+    :return: (x, y) float pixel coordinates in the frame
+    """
+    input_h, input_w = input_shape
+    frame_h, frame_w = frame_shape
+    gain = min(input_h / frame_h, input_w / frame_w)
+    pad_x = round((input_w - round(frame_w * gain)) / 2 - 0.1)
+    pad_y = round((input_h - round(frame_h * gain)) / 2 - 0.1)
+    # Pixel centers: pixel i covers [i, i + 1[
+    return (np.asarray(point, dtype=np.float64) + 0.5 - (pad_x, pad_y)) / gain - 0.5
+
+
+def mask_median_point(mask, subpixel: bool = False) -> np.ndarray | None:
+    """
+    Median point (x, y) of a binary mask, computed from its row and column histograms
+
+    The mask is reduced to its two marginals on its own device (one pass), then the
+    medians are read from the cumulative sums, in O(H + W), without listing the pixels.
+    Without subpixel, the result is the same as np.median over the mask pixels coordinates.
+    :param mask: (H, W) torch tensor or numpy array, pixels > 0.5 belong to the mask
+    :param subpixel: interpolate the median inside the pixel where it falls
+    :return: numpy array (x, y) in mask coordinates, None if the mask is empty
+    """
+    binary = mask > 0.5
+    if isinstance(binary, np.ndarray):
+        columns, rows = binary.sum(axis=0), binary.sum(axis=1)
+    else:
+        columns, rows = binary.sum(dim=0).cpu().numpy(), binary.sum(dim=1).cpu().numpy()
+
+    if columns.sum() == 0:
+        return None
+    return np.array([_histogram_median(columns, subpixel), _histogram_median(rows, subpixel)])
+
+
+def _histogram_median(histogram: np.ndarray, subpixel: bool) -> float:
+    """
+    Median of the values whose counts are given by the histogram
+    """
+    cumulative = np.cumsum(histogram)
+    total = int(cumulative[-1])
+
+    if subpixel:
+        # ? Each pixel is spread uniformly over [i - 0.5, i + 0.5]
+        index = int(np.searchsorted(cumulative, total / 2, side="left"))
+        if cumulative[index] == total / 2:
+            # ? The half ends exactly with this bin, the median is in the middle of the gap to the next non-empty bin
+            following = index + 1 + int(np.flatnonzero(histogram[index + 1 :])[0])
+            return (index + following) / 2
+        before = cumulative[index - 1] if index > 0 else 0
+        return index - 0.5 + (total / 2 - before) / histogram[index]
+
+    # Average of the two middle elements (the same one when total is odd)
+    lower = int(np.searchsorted(cumulative, (total - 1) // 2 + 1, side="left"))
+    upper = int(np.searchsorted(cumulative, total // 2 + 1, side="left"))
+    return (lower + upper) / 2
+
+
+def _to_raw(point: np.ndarray | None, scale: float) -> np.ndarray | None:
+    """
+    Bring a point from a resized frame back to the raw frame
+    """
+    if point is None:
+        return None
+    return np.asarray(point, dtype=np.float64) / scale
+
+
+def _to_pixel(point: np.ndarray | None) -> np.ndarray | None:
+    """
+    Integer pixel coordinates of a point
+    """
+    if point is None:
+        return None
+    return np.rint(point).astype(int)
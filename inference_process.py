@@ -0,0 +1,298 @@
+"""
+Inference in a separate process
+
+The YOLO models run in a child process, so they do not compete for the GIL
+with the Qt painting and the capture loop of the GUI process.
+
+The frames are not pickled: they are copied in a ring of preallocated slots in
+a shared memory block, only the slot index goes through the request queue. The
+results come back as a few floats on the result queue.
+
+    inference = InferenceProcess().start()  # Blocks until the models are loaded
+    result = inference.process(frame)       # Same as InferenceScheduler.process
+    inference.close()
+
+The child process runs the full InferenceScheduler (keyframes and tracking), so
+it is a drop-in replacement of the scheduler.
+"""
+
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing.shared_memory import SharedMemory
+
+import cv2
+import numpy as np
+from loguru import logger
+
+import inference_config
+from inference_engine import DetectionResult
+
+# Number of slots of the frames ring
+RING_SLOTS = 3
+# Seconds to wait for the models to load in the child process
+LOAD_TIMEOUT = 300.0
+# Seconds to wait for the result of a frame
+RESULT_TIMEOUT = 5.0
+# Seconds between two checks that the child process is alive, while waiting for a result
+LIVENESS_PERIOD = 0.1
+
+# Messages of the request queue
+MESSAGE_RING = "ring"  # (MESSAGE_RING, shared memory name, frame shape, slots): frames ring (re)allocated
+MESSAGE_FRAME = "frame"  # (MESSAGE_FRAME, sequence, slot): a frame is ready in the slot
+# Messages of the result queue
+MESSAGE_READY = "ready"  # (MESSAGE_READY, None): the models are loaded
+MESSAGE_ERROR = "error"  # (MESSAGE_ERROR, message): the child process failed
+MESSAGE_RESULT = "result"  # (MESSAGE_RESULT, (sequence, result values))
+
+
+class FrameRing:
+    """
+    Fixed-size ring of frame slots in a shared memory block
+    """
+
+    def __init__(self, shape: tuple[int, ...], slots: int = RING_SLOTS, name: str | None = None):
+        """
+        :param shape: shape of a frame (height, width, channels)
+        :param slots: number of frames in the ring
+        :param name: name of an existing block to attach to, a new block is created if None
+        """
+        self.shape: tuple[int, ...] = tuple(shape)
+        self.slots: int = slots
+        size = slots * int(np.prod(shape))
+        if name is None:
+            self.memory: SharedMemory = SharedMemory(create=True, size=size)
+        else:
+            # ? The creator owns the block, the resource tracker of this process must not unlink it
+            self.memory = SharedMemory(name=name, track=False)
+        self.frames: np.ndarray = np.ndarray((slots, *shape), dtype=np.uint8, buffer=self.memory.buf)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def close(self, unlink: bool = False):
+        del self.frames  # The view must be released before the block
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+class InferenceProcess:
+    """
+    Runs the InferenceScheduler in a child process, fed through a shared memory frames ring
+    """
+
+    def __init__(self, slots: int = RING_SLOTS):
+        self.slots: int = max(2, slots)
+        context = mp.get_context("spawn")
+        self._requests: mp.Queue = context.Queue()
+        self._results: mp.Queue = context.Queue()
+        self._process: mp.Process = context.Process(
+            target=_run_inference_process,
+            args=(self._requests, self._results),
+            name="inference",
+            daemon=True,
+        )
+        self._ring: FrameRing | None = None
+        self._next_slot: int = 0
+        self._busy_slots: dict[int, int] = {}  # Sequence -> slot still read by the child process
+        self._sequence: int = 0
+
+    def start(self) -> "InferenceProcess":
+        """
+        Start the child process and wait until its models are loaded
+        :raises RuntimeError: if the models can not be loaded
+        """
+        self._process.start()
+        deadline = time.monotonic() + LOAD_TIMEOUT
+        while True:
+            try:
+                message, payload = self._results.get(timeout=1.0)
+                break
+            except queue.Empty:
+                # ? The child process can die without answering (import error, killed)
+                if not self._process.is_alive():
+                    self.close()
+                    raise RuntimeError(f"The inference process exited with code {self._process.exitcode}") from None
+                if time.monotonic() > deadline:
+                    self.close()
+                    raise RuntimeError("The inference process did not load the models in time") from None
+        if message != MESSAGE_READY:
+            self.close()
+            raise RuntimeError(f"The inference process failed: {payload}")
+        logger.info(f"Inference process {self._process.pid} ready")
+        return self
+
+    def process(self, frame: cv2.Mat) -> DetectionResult:
+        """
+        Get the positions of the shoulders and marker on the frame, like InferenceScheduler.process
+        :return: DetectionResult in raw frame coordinates, nothing detected if the child process does not answer
+        """
+        if not self._process.is_alive():
+            logger.error("The inference process is not running")
+            return DetectionResult(None, None, None)
+
+        if self._ring is None or self._ring.shape != frame.shape:
+            self._allocate_ring(frame.shape)
+
+        slot = self._free_slot()
+        if slot is None:
+            logger.warning("Every slot of the frames ring is still in use")
+            return DetectionResult(None, None, None)
+
+        self._sequence += 1
+        np.copyto(self._ring.frames[slot], frame)
+        self._busy_slots[self._sequence] = slot
+        self._requests.put((MESSAGE_FRAME, self._sequence, slot))
+        return self._wait_result(self._sequence)
+
+    def close(self):
+        if self._process.is_alive():
+            self._requests.put(None)
+            self._process.join(timeout=5.0)
+            if self._process.is_alive():
+                self._process.terminate()
+        if self._ring is not None:
+            self._ring.close(unlink=True)
+            self._ring = None
+
+    def _allocate_ring(self, shape: tuple[int, ...]):
+        """
+        (Re)allocate the ring for frames of this shape, the child process attaches to the new block
+        """
+        if self._ring is not None:
+            self._drain(timeout=RESULT_TIMEOUT)
+            self._ring.close(unlink=True)
+        self._ring = FrameRing(shape, self.slots)
+        self._busy_slots.clear()
+        self._requests.put((MESSAGE_RING, self._ring.name, self._ring.shape, self.slots))
+        logger.info(f"Frames ring of {self.slots} slots of {shape} allocated")
+
+    def _free_slot(self) -> int | None:
+        """
+        Next slot of the ring that the child process is not reading, collecting the late results first
+        """
+        self._drain(timeout=0.0)
+        busy = set(self._busy_slots.values())
+        for offset in range(self.slots):
+            slot = (self._next_slot + offset) % self.slots
+            if slot not in busy:
+                self._next_slot = (slot + 1) % self.slots
+                return slot
+        return None
+
+    def _wait_result(self, sequence: int) -> DetectionResult:
+        """
+        Wait for the result of the frame, the results of older frames (late answers) are dropped
+        """
+        deadline = time.monotonic() + RESULT_TIMEOUT
+        while True:
+            try:
+                message, payload = self._results.get(timeout=LIVENESS_PERIOD)
+            except queue.Empty:
+                # ? A dead child process will never answer, do not block the caller until the timeout
+                if not self._process.is_alive():
+                    logger.error(f"The inference process exited with code {self._process.exitcode}")
+                    return DetectionResult(None, None, None)
+                if time.monotonic() > deadline:
+                    logger.warning(f"No result for frame {sequence}")
+                    return DetectionResult(None, None, None)
+                continue
+
+            if message == MESSAGE_ERROR:
+                logger.error(f"Inference process error: {payload}")
+                continue
+            result_sequence, values = payload
+            self._busy_slots.pop(result_sequence, None)
+            if result_sequence == sequence:
+                return _to_result(values)
+
+    def _drain(self, timeout: float):
+        """
+        Collect the pending results, to free their slots
+        """
+        while self._busy_slots:
+            try:
+                message, payload = self._results.get(timeout=timeout) if timeout else self._results.get_nowait()
+            except queue.Empty:
+                return
+            if message == MESSAGE_ERROR:
+                logger.error(f"Inference process error: {payload}")
+            elif message == MESSAGE_RESULT:
+                self._busy_slots.pop(payload[0], None)
+
+
+def _to_values(result: DetectionResult) -> tuple:
+    """
+    Plain values of a result, cheap to send on a queue
+    """
+
+    def point(value):
+        return None if value is None else (int(value[0]), int(value[1]))
+
+    return (
+        point(result.left_shoulder),
+        point(result.right_shoulder),
+        point(result.marker),
+        result.left_shoulder_confidence,
+        result.right_shoulder_confidence,
+        result.marker_confidence,
+    )
+
+
+def _to_result(values: tuple) -> DetectionResult:
+    def point(value):
+        return None if value is None else np.array(value, dtype=int)
+
+    left, right, marker, left_confidence, right_confidence, marker_confidence = values
+    return DetectionResult(point(left), point(right), point(marker), left_confidence, right_confidence, marker_confidence)
+
+
+def _run_inference_process(requests: mp.Queue, results: mp.Queue):
+    """
+    Main of the child process: load the models, then answer the frames until None is received
+    """
+    # ? Imported in the child only: the spawned process loads the models, the parent process never does
+    from inference_engine import InferenceEngine  # noqa: PLC0415
+    from inference_scheduler import InferenceScheduler  # noqa: PLC0415
+
+    try:
+        engine = InferenceEngine.from_config()
+        engine.infer(np.zeros((480, 640, 3), dtype=np.uint8))  # First inference does the lazy initializations
+        scheduler = InferenceScheduler(
+            engine,
+            keyframe_interval=inference_config.keyframe_interval,
+            motion_threshold=inference_config.motion_threshold,
+        )
+    except Exception as e:  # ? The GUI process waits for an answer
+        results.put((MESSAGE_ERROR, str(e)))
+        return
+    results.put((MESSAGE_READY, None))
+
+    ring = None
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+
+        if request[0] == MESSAGE_RING:
+            _, name, shape, slots = request
+            if ring is not None:
+                ring.close()
+            ring = FrameRing(shape, slots, name=name)
+            engine.reset()
+            scheduler.reset()
+            continue
+
+        _, sequence, slot = request
+        try:
+            result = scheduler.process(ring.frames[slot])
+        except Exception as e:
+            results.put((MESSAGE_ERROR, str(e)))
+            result = DetectionResult(None, None, None)
+        results.put((MESSAGE_RESULT, (sequence, _to_values(result))))
+
+    if ring is not None:
+        ring.close()
+    engine.close()
@@ -0,0 +1,174 @@
+"""
+Adaptive inference scheduler
+
+Running both YOLO models on every frame is wasteful when the patient and the
+palpation device barely move. The scheduler only runs the full detection on
+keyframes:
+- Every `keyframe_interval` frames
+- When the motion between two frames exceeds `motion_threshold`
+- When the tracking is lost
+
+In between, the shoulders and marker are propagated with a sparse optical
+flow (Lucas-Kanade) on a downscaled grayscale frame, which is cheap.
+"""
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from inference_engine import DetectionResult, InferenceEngine
+
+# Order of the tracked points
+LEFT_SHOULDER, RIGHT_SHOULDER, MARKER = range(3)
+
+# Lucas-Kanade parameters
+LK_PARAMS = {
+    "winSize": (21, 21),
+    "maxLevel": 2,
+    "criteria": (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03),
+}
+# Maximum forward-backward error (in tracking image pixels) to accept a tracked point
+MAX_FORWARD_BACKWARD_ERROR = 1.0
+
+
+class InferenceScheduler:
+    """
+    Decides for each frame if the models must run (keyframe) or if the
+    previous positions can be tracked
+    """
+
+    def __init__(
+        self,
+        engine: InferenceEngine,
+        keyframe_interval: int = 5,
+        motion_threshold: float = 6.0,
+        tracking_width: int = 320,
+    ):
+        """
+        :param engine: inference engine used on keyframes
+        :param keyframe_interval: run the detection every N frames, 1 disables the tracking
+        :param motion_threshold: mean absolute difference (0-255) between two frames forcing a detection
+        :param tracking_width: width of the grayscale frame used for the motion and the tracking
+        """
+        self.engine: InferenceEngine = engine
+        self.keyframe_interval: int = max(1, keyframe_interval)
+        self.motion_threshold: float = motion_threshold
+        self.tracking_width: int = tracking_width
+
+        self.count_detected_frames: int = 0
+        self.count_tracked_frames: int = 0
+
+        self._previous_gray: np.ndarray = None
+        # Positions of the left shoulder, right shoulder and marker in raw frame coordinates, NaN if unknown
+        self._points: np.ndarray = np.full((3, 2), np.nan, dtype=np.float32)
+        # Confidences of the last detection, carried over the tracked frames
+        self._confidences: np.ndarray = np.zeros(3, dtype=np.float32)
+        self._frames_since_keyframe: int = 0
+
+    @property
+    def detect_ratio(self) -> float:
+        """
+        Ratio of frames where the full detection ran
+        """
+        total = self.count_detected_frames + self.count_tracked_frames
+        return self.count_detected_frames / total if total else 0.0
+
+    def reset(self):
+        """
+        Force a detection on the next frame
+        """
+        self._previous_gray = None
+        self._points[:] = np.nan
+
+    def process(self, frame: cv2.Mat) -> DetectionResult:
+        """
+        Get the positions of the shoulders and marker on the frame
+        :param frame: raw frame from the camera
+        :return: DetectionResult in raw frame coordinates
+        """
+        gray, scale = self._tracking_image(frame)
+
+        if not self._is_keyframe(gray):
+            points = self._track(gray, scale)
+            if points is not None:
+                self._points = points
+                self._previous_gray = gray
+                self._frames_since_keyframe += 1
+                self.count_tracked_frames += 1
+                return self._result()
+
+        return self._detect(frame, gray)
+
+    def _tracking_image(self, frame: cv2.Mat) -> tuple[np.ndarray, float]:
+        """
+        Small grayscale version of the frame used for motion and tracking
+        :return: tuple of (gray image, scale from raw frame to gray image)
+        """
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.tracking_width / width)
+        small = cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), scale
+
+    def _is_keyframe(self, gray: np.ndarray) -> bool:
+        if self._previous_gray is None or self._previous_gray.shape != gray.shape:
+            return True
+        if self._frames_since_keyframe + 1 >= self.keyframe_interval:
+            return True
+        if np.isnan(self._points).all():
+            return True
+
+        motion = float(cv2.absdiff(gray, self._previous_gray).mean())
+        return motion > self.motion_threshold
+
+    def _detect(self, frame: cv2.Mat, gray: np.ndarray) -> DetectionResult:
+        result = self.engine.infer(frame)
+
+        self._points[:] = np.nan
+        self._confidences[:] = (result.left_shoulder_confidence, result.right_shoulder_confidence, result.marker_confidence)
+        if result.left_shoulder is not None and result.right_shoulder is not None:
+            self._points[LEFT_SHOULDER] = result.left_shoulder
+            self._points[RIGHT_SHOULDER] = result.right_shoulder
+        if result.marker is not None:
+            self._points[MARKER] = result.marker
+
+        self._previous_gray = gray
+        self._frames_since_keyframe = 0
+        self.count_detected_frames += 1
+        return result
+
+    def _track(self, gray: np.ndarray, scale: float) -> np.ndarray | None:
+        """
+        Propagate the known points from the previous frame with the optical flow
+        :return: the new points in raw frame coordinates, None if the tracking is lost
+        """
+        known = ~np.isnan(self._points).any(axis=1)
+        previous_points = (self._points[known] * scale).reshape(-1, 1, 2)
+
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(self._previous_gray, gray, previous_points, None, **LK_PARAMS)
+        if next_points is None or not status.all():
+            logger.trace("Tracking lost, running the detection")
+            return None
+
+        # ? Track back to the previous frame to reject drifting points
+        back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self._previous_gray, next_points, None, **LK_PARAMS)
+        error = np.linalg.norm(back_points - previous_points, axis=2)
+        if not back_status.all() or (error > MAX_FORWARD_BACKWARD_ERROR).any():
+            logger.trace("Tracking drifted, running the detection")
+            return None
+
+        points = np.full_like(self._points, np.nan)
+        points[known] = next_points.reshape(-1, 2) / scale
+        return points
+
+    def _result(self) -> DetectionResult:
+        def to_coord(point: np.ndarray) -> np.ndarray | None:
+            return None if np.isnan(point).any() else np.rint(point).astype(int)
+
+        return DetectionResult(
+            left_shoulder=to_coord(self._points[LEFT_SHOULDER]),
+            right_shoulder=to_coord(self._points[RIGHT_SHOULDER]),
+            marker=to_coord(self._points[MARKER]),
+            left_shoulder_confidence=float(self._confidences[LEFT_SHOULDER]),
+            right_shoulder_confidence=float(self._confidences[RIGHT_SHOULDER]),
+            marker_confidence=float(self._confidences[MARKER]),
+        )
@@ -16,12 +16,8 @@ from PyQt6.QtWidgets import (
     QWidget,
 )
 
-from other_pain import OtherPain
-from pain_intensity import PainIntensity
-from pain_localization import PainLocalization
-from pain_type import PainType
-from palpation import Palpation
-from patient_identification import PatientIdentification
+from metrics import start_summary_logging, stop_summary_logging
+from tab_registry import LazyTabRegistry, TabSpec
 from toaster import Toaster
 
 # ! ---------- Logger ----------
@@ -37,6 +33,19 @@ logger.add(
 
 MAIN_MARGINS: tuple[int, int, int, int] = (10, 10, 10, 10)
 
+# ! Tabs of the application, in the order of the steps
+# ? The modules are only imported when the tab is first shown, keep them out of the imports of this file
+TABS: list[TabSpec] = [
+    TabSpec("Patient identification", "patient_identification", "PatientIdentification"),
+    TabSpec("Pain type", "pain_type", "PainType"),
+    # Preloaded: the capture and the background loading of the models start with the application
+    TabSpec("Pain localization", "pain_localization", "PainLocalization", preload=True, start_logic=True),
+    # The logic records the palpation trajectory from the live tracking of the pain localization
+    TabSpec("Palpation", "palpation", "Palpation", start_logic=True),
+    TabSpec("Pain intensity", "pain_intensity", "PainIntensity"),
+    TabSpec("Other pain", "other_pain", "OtherPain"),
+]
+
 
 class MainApp(QMainWindow):
     """
@@ -71,41 +80,17 @@ class MainApp(QMainWindow):
 
         self.toaster = Toaster(self)
 
-        # ! Init the different tabs
-        self.patient_identification: PatientIdentification = PatientIdentification(
-            self.patient_data,
-            self.tab_widget,
-            self.toaster,
-        )
-        self.pain_type: PainType = PainType(
-            self.patient_data,
-            self.tab_widget,
-            self.toaster,
-        )
-        self.pain_localization: PainLocalization = PainLocalization(
-            self.patient_data,
-            self.tab_widget,
-            self.toaster,
-        )
-        self.palpation: Palpation = Palpation(
-            self.patient_data,
-            self.tab_widget,
-            self.toaster,
-        )
-        self.pain_intensity: PainIntensity = PainIntensity(
-            self.patient_data,
-            self.tab_widget,
-            self.toaster,
-        )
-        self.other_pain: OtherPain = OtherPain(
-            self.patient_data,
-            self.tab_widget,
-            self.toaster,
-        )
-
         # ! Init the worker thread
         self.threadpool = QtCore.QThreadPool()
-        self.threadpool.start(self.pain_localization.logic)
+
+        # ! The tabs are built on their first visit
+        self.tabs: LazyTabRegistry = LazyTabRegistry(
+            self.tab_widget,
+            TABS,
+            (self.patient_data, self.tab_widget, self.toaster),
+            self.threadpool,
+        )
+        self.pick_grid_started: bool = False
 
         self.init_ui()
 
@@ -129,23 +114,8 @@ class MainApp(QMainWindow):
         main_layout.addWidget(self.tab_widget)
         self.tab_widget.tabBar().hide()  # hide the tab bar
 
-        # ! First tab :Patient Identification
-        self.tab_widget.addTab(self.patient_identification.gui, "Patient identification")
-
-        # ! Second tab : Pain type
-        self.tab_widget.addTab(self.pain_type.gui, "Pain type")
-
-        # ! Third tab : Pain localization
-        self.tab_widget.addTab(self.pain_localization.gui, "Pain localization")
-
-        # ! Palpation
-        self.tab_widget.addTab(self.palpation.gui, "Palpation")
-
-        # ! Pain intensity
-        self.tab_widget.addTab(self.pain_intensity.gui, "Pain intensity")
-
-        # ! Pain intensity
-        self.tab_widget.addTab(self.other_pain.gui, "Other pain")
+        # ! Tabs : Patient identification, Pain type, Pain localization, Palpation, Pain intensity, Other pain
+        self.tabs.install()
 
         # ! --- simple label
         header_layout = QHBoxLayout()
@@ -155,12 +125,33 @@ class MainApp(QMainWindow):
 
         self.show()
 
+        # ! Heavier work starts once the window is shown
+        QtCore.QTimer.singleShot(0, self.start_background_tasks)
+
+    def start_background_tasks(self):
+        """
+        Build the preloaded tabs (the models load in the background) and precompute the atlas answers
+        """
+        self.tabs.preload()
+        start_summary_logging()
+
+        # ? atlas_local imports requests and the atlas client, kept out of the start of the application (check_startup.py)
+        from atlas_local import start_pick_grid  # noqa: PLC0415
+
+        start_pick_grid()
+        self.pick_grid_started = True
+
     def closeEvent(self, a0):
         # print(self.patient_data)
         print("Closing app")
-        self.pain_localization.logic.stop()
+        self.tabs.stop()
+        if self.pick_grid_started:
+            from atlas_local import stop_pick_grid  # noqa: PLC0415 - already imported by start_background_tasks
+
+            stop_pick_grid()
         self.threadpool.clear()
         self.threadpool.waitForDone()
+        stop_summary_logging()
 
         if a0 is not None:
             a0.accept()
@@ -0,0 +1,233 @@
+"""
+Lightweight instrumentation of the application
+
+Three kinds of measures, all kept in memory on a rolling window:
+- Timers: durations of a step (monotonic clock), summarized by percentiles
+- Rates: events per second (captured frames, processed frames)
+- Counters: totals (cache hits, dropped frames...)
+
+    with timer("atlas.pick"):
+        ...
+    tick("capture")
+    count("atlas.pick_cache_hit")
+
+A summary is logged periodically (start_summary_logging), and the live numbers
+can be drawn on the video preview (hud_lines).
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+from loguru import logger
+
+# ! Instrumentation settings
+HUD_ENABLED = False  # Draw the live numbers on the video preview
+SUMMARY_PERIOD = 60.0  # Seconds between two summaries in the log, 0 disables them
+WINDOW_SIZE = 300  # Number of last measures kept per timer and rate
+
+# Timers and rates shown on the HUD, in this order
+HUD_TIMERS = ("compute.frame", "inference.keypoint", "inference.segmentation", "atlas.pick")
+HUD_RATES = ("capture", "compute")
+
+
+class RollingStats:
+    """
+    Last `window_size` values of a measure
+    """
+
+    def __init__(self, window_size: int = WINDOW_SIZE):
+        self.values: deque[float] = deque(maxlen=window_size)
+        self.count: int = 0
+
+    def add(self, value: float):
+        self.values.append(value)
+        self.count += 1
+
+    def summary(self) -> dict:
+        """
+        :return: count (since the start), mean, p50, p95, p99 and max of the window
+        """
+        if not self.values:
+            return {"count": self.count, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+        values = np.fromiter(self.values, dtype=np.float64, count=len(self.values))
+        p50, p95, p99 = np.percentile(values, (50, 95, 99))
+        return {
+            "count": self.count,
+            "mean": float(values.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(values.max()),
+        }
+
+
+class Metrics:
+    """
+    Registry of the timers, rates and counters, shared by every thread
+    """
+
+    def __init__(self, window_size: int = WINDOW_SIZE):
+        self.window_size: int = window_size
+        self._lock: threading.Lock = threading.Lock()
+        self._timers: dict[str, RollingStats] = {}
+        self._events: dict[str, deque[float]] = {}
+        self._counters: dict[str, int] = {}
+
+    def observe(self, name: str, seconds: float):
+        """
+        Add a duration to a timer
+        """
+        with self._lock:
+            stats = self._timers.get(name)
+            if stats is None:
+                stats = self._timers[name] = RollingStats(self.window_size)
+            stats.add(seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        Time the block, even if it raises
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def tick(self, name: str):
+        """
+        Record an event of a rate
+        """
+        with self._lock:
+            events = self._events.get(name)
+            if events is None:
+                events = self._events[name] = deque(maxlen=self.window_size)
+            events.append(time.monotonic())
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def rate(self, name: str) -> float:
+        """
+        Events per second over the window, 0 if not enough events
+        """
+        with self._lock:
+            events = self._events.get(name)
+            if not events or len(events) < 2 or events[-1] == events[0]:
+                return 0.0
+            return (len(events) - 1) / (events[-1] - events[0])
+
+    def timer_summary(self, name: str) -> dict | None:
+        """
+        Summary of a timer in seconds, None if it never ran
+        """
+        with self._lock:
+            stats = self._timers.get(name)
+            return None if stats is None else stats.summary()
+
+    def snapshot(self) -> dict:
+        """
+        Every measure: timers (seconds), rates (events per second) and counters
+        """
+        with self._lock:
+            timers = {name: stats.summary() for name, stats in self._timers.items()}
+            counters = dict(self._counters)
+            rate_names = list(self._events)
+        return {
+            "timers": timers,
+            "rates": {name: self.rate(name) for name in rate_names},
+            "counters": counters,
+        }
+
+    def reset(self, window_size: int | None = None):
+        """
+        Forget every measure
+        :param window_size: new size of the rolling windows, unchanged if None
+        """
+        with self._lock:
+            if window_size is not None:
+                self.window_size = window_size
+            self._timers.clear()
+            self._events.clear()
+            self._counters.clear()
+
+
+# ! Metrics of the application
+metrics: Metrics = Metrics()
+timer = metrics.timer
+observe = metrics.observe
+tick = metrics.tick
+count = metrics.count
+
+
+def format_summary(snapshot: dict | None = None) -> str:
+    """
+    Human readable summary, one measure per line, durations in milliseconds
+    """
+    snapshot = snapshot or metrics.snapshot()
+    lines = []
+    for name, rate in sorted(snapshot["rates"].items()):
+        lines.append(f"{name}: {rate:.1f}/s")
+    for name, stats in sorted(snapshot["timers"].items()):
+        if stats["p50"] is None:
+            continue
+        lines.append(
+            f"{name}: p50 {1000 * stats['p50']:.1f}ms, p95 {1000 * stats['p95']:.1f}ms, "
+            f"max {1000 * stats['max']:.1f}ms (n={stats['count']})"
+        )
+    for name, value in sorted(snapshot["counters"].items()):
+        lines.append(f"{name}: {value}")
+    return "\n".join(lines)
+
+
+def hud_lines() -> list[str]:
+    """
+    Short lines of the live numbers, for the video preview
+    """
+    lines = [f"{name}: {metrics.rate(name):.1f} fps" for name in HUD_RATES]
+    for name in HUD_TIMERS:
+        stats = metrics.timer_summary(name)
+        if stats is not None and stats["p50"] is not None:
+            lines.append(f"{name}: {1000 * stats['p50']:.0f}/{1000 * stats['p95']:.0f} ms")
+    return lines
+
+
+_summary_stopped: threading.Event = threading.Event()
+_summary_thread: threading.Thread | None = None
+
+
+def start_summary_logging(period: float = SUMMARY_PERIOD):
+    """
+    Log the summary every `period` seconds in a background thread
+    """
+    global _summary_thread
+    if period <= 0 or _summary_thread is not None:
+        return
+
+    def log_summaries():
+        while not _summary_stopped.wait(period):
+            summary = format_summary()
+            if summary:
+                logger.info(f"Metrics over the last {WINDOW_SIZE} measures:\n{summary}")
+
+    _summary_stopped.clear()
+    _summary_thread = threading.Thread(target=log_summaries, name="metrics-summary", daemon=True)
+    _summary_thread.start()
+
+
+def stop_summary_logging():
+    """
+    Stop the periodic summary and log a last one
+    """
+    global _summary_thread
+    if _summary_thread is None:
+        return
+    _summary_stopped.set()
+    _summary_thread = None
+    summary = format_summary()
+    if summary:
+        logger.info(f"Metrics at exit:\n{summary}")
@@ -3,12 +3,16 @@ from multiprocessing.synchronize import Event as EventClass
 
 import cv2 as cv
 from loguru import logger
-from PyQt6.QtCore import QRunnable, Qt
+from PyQt6.QtCore import QObject, QRunnable, Qt, QThreadPool, pyqtSignal
 from PyQt6.QtWidgets import QHBoxLayout, QLabel, QPushButton, QSizePolicy, QVBoxLayout, QWidget
 
+from atlas_render import render_structures_images
 from report_creator import ReportCreator
 from toaster import Toaster
 
+REPORT_TEMPLATE_DIR = "report_template"
+REPORT_TEMP_DIR = "report_temp_dir"
+
 
 class OtherPain:
     def __init__(self, patient_data: dict, tab_widget: QWidget, toaster: Toaster):
@@ -34,6 +38,7 @@ class OtherPainGUI(QWidget):
         self.main_layout = QVBoxLayout()
         self.main_layout.setContentsMargins(30, 30, 30, 30)
         self.setLayout(self.main_layout)
+        self.report_job: ReportJob = None
         self.init_ui()
 
     # ! ---------- UI ----------
@@ -81,13 +86,81 @@ class OtherPainGUI(QWidget):
     def on_no_clicked(self) -> None:
         logger.info("No button clicked, generating report...")
 
-        template_dir = "report_template"
-        report_temp_dir = "report_temp_dir"
+        # ! The report (atlas renders and compilation) is built in the thread pool, the GUI keeps running
+        self.set_buttons_enabled(False)
+        self.no_button.setText("Génération du rapport...")
+        self.report_job = ReportJob(self.other_pain.patient_data)
+        self.report_job.signals.finished.connect(self.on_report_finished)
+        self.report_job.signals.failed.connect(self.on_report_failed)
+        QThreadPool.globalInstance().start(self.report_job)
+
+    def on_report_finished(self, report_path: str) -> None:
+        self.report_job = None
+        self.set_buttons_enabled(True)
+        self.other_pain.toaster.show_sucess(f"Rapport généré : {report_path}")
+
+    def on_report_failed(self, message: str) -> None:
+        self.report_job = None
+        self.set_buttons_enabled(True)
+        self.other_pain.toaster.show_error(f"Génération du rapport impossible : {message}")
+
+    def set_buttons_enabled(self, enabled: bool) -> None:
+        self.no_button.setEnabled(enabled)
+        self.yes_button.setEnabled(enabled)
+        self.no_button.setText("Finir le test")
+
+    def on_yes_clicked(self) -> None:
+        # Get the current pain index from the pain_count
+        pain_index = self.other_pain.patient_data.get("pain_count", 0)
+        # Increment the pain_count for the next pain
+        self.other_pain.patient_data["pain_count"] = pain_index + 1
+
+        # Come back to pain type tab
+        self.other_pain.tab_widget.setCurrentIndex(1)
+
+    def __init_footer(self) -> None:
+        pass
+
+
+class ReportJobSignals(QObject):
+    """
+    Signals of the ReportJob, received in the GUI thread
+    """
 
+    finished = pyqtSignal(str)  # path of the PDF report
+    failed = pyqtSignal(str)  # error message
+
+
+class ReportJob(QRunnable):
+    """
+    Report job, runs in the Qt thread pool
+
+    It renders the structures of every pain with the atlas (network) and
+    compiles the PDF report, without blocking the GUI.
+    """
+
+    def __init__(self, patient_data: dict):
+        super().__init__()
+        self.patient_data: dict[str] = patient_data
+        self.signals: ReportJobSignals = ReportJobSignals()
+
+    def run(self) -> None:
+        try:
+            report_path = self.build_report()
+        except Exception as e:  # ? The job must always answer the GUI
+            logger.exception("Report generation failed")
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(report_path)
+
+    def build_report(self) -> str:
+        """
+        :return: path of the compiled PDF report
+        """
         report_creator = ReportCreator(
-            template_dir=template_dir,
-            report_temp_dir=report_temp_dir,
-            report_output_pdf=f"{self.other_pain.patient_data['firstname']}_{self.other_pain.patient_data['lastname']}_report.pdf",
+            template_dir=REPORT_TEMPLATE_DIR,
+            report_temp_dir=REPORT_TEMP_DIR,
+            report_output_pdf=f"{self.patient_data['firstname']}_{self.patient_data['lastname']}_report.pdf",
         )
 
         report_creator.add_title("Rapport de douleur")
@@ -96,39 +169,49 @@ class OtherPainGUI(QWidget):
 
         report_creator.add_list(
             [
-                f"Prenom: {self.other_pain.patient_data['firstname']}\r",
-                f"Nom de famille: {self.other_pain.patient_data['lastname']}\r",
-                f"Date de naissance: {self.other_pain.patient_data['data_of_birth']}\r",
+                f"Prenom: {self.patient_data['firstname']}\r",
+                f"Nom de famille: {self.patient_data['lastname']}\r",
+                f"Date de naissance: {self.patient_data['data_of_birth']}\r",
             ]
         )
 
-        pain_count = self.other_pain.patient_data.get("pain_count", 0)
+        pain_count = self.patient_data.get("pain_count", 0)
         logger.debug(f"Number of pains to report: {pain_count}")
+
+        # ! Render the structures of all the pains at once, the renders run in parallel
+        structures_by_pain = {}
+        for i in range(pain_count + 1):
+            structures = self.patient_data.get(f"structures_{i}", [])
+            if structures and isinstance(structures, list):
+                structures_by_pain[i] = structures
+        structures_images = render_structures_images(structures_by_pain, REPORT_TEMP_DIR)
+        logger.debug(f"Atlas renders: {len(structures_images)}/{len(structures_by_pain)}")
+
         for i in range(pain_count + 1):
             report_creator.add_pagebreak()
             report_creator.add_subtitle(f"Douleur n°{i + 1}")
             report_creator.add_paragraph(
-                f"Type de douleur: {self.other_pain.patient_data.get(f'pain_type_{i}', 'Non spécifié')}\r",
+                f"Type de douleur: {self.patient_data.get(f'pain_type_{i}', 'Non spécifié')}\r",
             )
 
-            if self.other_pain.patient_data.get(f"pain_type_{i}") == "Douleur Continue":
+            if self.patient_data.get(f"pain_type_{i}") == "Douleur Continue":
                 report_creator.add_paragraph(
-                    f"Intensité de la douleur: {self.other_pain.patient_data.get(f'pain_intensity1_{i}', 'Non spécifié')}\r"
+                    f"Intensité de la douleur: {self.patient_data.get(f'pain_intensity1_{i}', 'Non spécifié')}\r"
                 )
             else:
                 report_creator.add_list(
                     [
-                        f"Intensité de la douleur continue : {self.other_pain.patient_data.get(f'pain_intensity1_{i}', 'Non spécifié')}\r",
-                        f"Intensité de la douleur à la palpation : {self.other_pain.patient_data.get(f'pain_intensity2_{i}', 'Non spécifié')}\r",
+                        f"Intensité de la douleur continue : {self.patient_data.get(f'pain_intensity1_{i}', 'Non spécifié')}\r",
+                        f"Intensité de la douleur à la palpation : {self.patient_data.get(f'pain_intensity2_{i}', 'Non spécifié')}\r",
                     ]
                 )
 
             ff = f"saved_img_{i}"
-            pain_localization_image: cv.Mat = self.other_pain.patient_data.get(ff, None)
+            pain_localization_image: cv.Mat = self.patient_data.get(ff, None)
             logger.debug(f"{ff = }")
-            logger.debug(f"{self.other_pain.patient_data[ff].sum()=}")
-            # logger.debug(f"img sum {self.other_pain.patient_data[f'saved_img_{0}'].sum()}")
-            # logger.debug(f"img sum {self.other_pain.patient_data[f'saved_img_{1}'].sum()}")
+            logger.debug(f"{self.patient_data[ff].sum()=}")
+            # logger.debug(f"img sum {self.patient_data[f'saved_img_{0}'].sum()}")
+            # logger.debug(f"img sum {self.patient_data[f'saved_img_{1}'].sum()}")
 
             path = report_creator.save_image(
                 filename=f"image_{i + 1}.png",
@@ -143,28 +226,22 @@ class OtherPainGUI(QWidget):
             )
 
             # TODO : Format the structures to be more readable
-            structures = self.other_pain.patient_data.get(f"structures_{i}", [])
+            structures = self.patient_data.get(f"structures_{i}", [])
             report_creator.add_paragraph("Structures à la localisation de la douleur")
             if structures and isinstance(structures, list):
                 report_creator.add_list(structures)
+                if i in structures_images:
+                    report_creator.add_image(
+                        image_path=structures_images[i],
+                        caption=f"Structures Douleur N°{i + 1}",
+                    )
             else:
                 report_creator.add_paragraph("Non spécifié\r")
 
         logger.info("Starting to compile the report...")
         report_creator.compile_report()
         logger.info("Report compiled successfully.")
-
-    def on_yes_clicked(self) -> None:
-        # Get the current pain index from the pain_count
-        pain_index = self.other_pain.patient_data.get("pain_count", 0)
-        # Increment the pain_count for the next pain
-        self.other_pain.patient_data["pain_count"] = pain_index + 1
-
-        # Come back to pain type tab
-        self.other_pain.tab_widget.setCurrentIndex(1)
-
-    def __init_footer(self) -> None:
-        pass
+        return report_creator.report_output_pdf
 
 
 class OtherPainLogic(QRunnable):
@@ -1,18 +1,28 @@
 import multiprocessing as mp
 import sys
 import threading
+import time
 from multiprocessing.synchronize import Event as EventClass
 
 import cv2
 import numpy as np
 from loguru import logger
-from PyQt6.QtCore import QObject, QRunnable, Qt, QTimer, pyqtSignal
+from PyQt6.QtCore import QObject, QRunnable, Qt, QThreadPool, QTimer, pyqtSignal
 from PyQt6.QtGui import QImage, QPixmap
 from PyQt6.QtWidgets import QHBoxLayout, QLabel, QPushButton, QSizePolicy, QVBoxLayout, QWidget
-from ultralytics import YOLO
 
+import inference_config
+import metrics
 import video_source
-from atlas import send_pick_request
+from atlas_local import pick_structures
+from avatar_mapping import CALIBRATION_KEY, CALIBRATION_LANDMARKS, fit_calibration, map_to_avatar, patient_calibration
+from capture import VideoCaptureAsync
+from frame_mailbox import FrameMailbox
+from inference_engine import DetectionResult, InferenceEngine
+from inference_process import InferenceProcess
+from inference_scheduler import InferenceScheduler
+from preview import PreviewRenderer
+from smoothing import PositionSmoother
 from toaster import Toaster
 
 # Set the logger as enqueue
@@ -25,6 +35,16 @@ logger.add(
     backtrace=True,
 )
 
+# ! Logic of the pain localization tab, the next steps follow its live tracking
+_live_logic: "PainLocalizationLogic | None" = None
+
+
+def get_live_logic() -> "PainLocalizationLogic | None":
+    """
+    Running logic of the pain localization tab, None if the tab was not built yet
+    """
+    return _live_logic
+
 
 class PainLocalization:
     """
@@ -60,6 +80,10 @@ class PainLocalizationGUI(QWidget):
         self.main_layout.setSpacing(20)
         self.pain_localization: PainLocalization = parent
         self.captured_frame: QImage = None
+        self.pick_job: PickJob = None
+        self.pick_job_id: int = 0
+        self.calibrating: bool = False
+        self.calibration_positions: list[DetectionResult] = []  # Device on each landmark of CALIBRATION_LANDMARKS
 
         self.init_ui()
 
@@ -135,6 +159,12 @@ class PainLocalizationGUI(QWidget):
         self.ok_button.setEnabled(False)  # Initially disabled
         self.ok_button.clicked.connect(self.on_ok_clicked)
 
+        self.calibration_button = QPushButton("Calibrer", self)
+        self.calibration_button.setStyleSheet("background-color: gray; color: white;")
+        self.calibration_button.setEnabled(False)  # Enabled once the models are ready
+        self.calibration_button.clicked.connect(self.on_calibration_clicked)
+
+        buttons_layout.addWidget(self.calibration_button)
         buttons_layout.addWidget(self.timer_button)
         buttons_layout.addWidget(self.ok_button)
 
@@ -148,6 +178,86 @@ class PainLocalizationGUI(QWidget):
         self.timer_update_label = QTimer(self)
         self.timer_update_label.timeout.connect(self.set_current_timer_label)
 
+        # ! The models are loaded in the background, the timer is only available once they are ready
+        logic = self.pain_localization.logic
+        logic.signals.models_ready.connect(self.on_models_ready)
+        logic.signals.models_failed.connect(self.on_models_failed)
+        logic.signals.capture_failed.connect(self.on_capture_failed)
+        if logic.models_ready.is_set():
+            self.on_models_ready()
+        else:
+            self.timer_button.setEnabled(False)
+            self.timer_button.setText("Chargement des modèles...")
+            self.timer_button.setStyleSheet("background-color: gray; color: white;")
+
+    def on_models_ready(self):
+        self.timer_button.setEnabled(True)
+        self.timer_button.setText("Lancer un timer")
+        self.timer_button.setStyleSheet("background-color: green; color: white;")
+        self.calibration_button.setEnabled(True)
+        self.calibration_button.setStyleSheet("background-color: #1f6fb2; color: white;")
+
+    def on_models_failed(self, message: str):
+        self.timer_button.setText("Modèles indisponibles")
+        self.pain_localization.toaster.show_error(f"Chargement des modèles impossible : {message}")
+
+    def on_capture_failed(self, message: str):
+        self.pain_localization.toaster.show_error(f"Caméra indisponible : {message}")
+
+    def on_calibration_clicked(self):
+        """
+        Start the calibration, then record the device held on each landmark
+        The calibration of the patient is fitted after the last one
+        """
+        if not self.calibrating:
+            self.calibrating = True
+            self.calibration_positions = []
+            self.set_calibration_label()
+            self.pain_localization.toaster.show_info("Placez le dispositif sur chaque repère puis cliquez.")
+            return
+
+        _, positions = self.pain_localization.logic.get_positions()
+        if positions.left_shoulder is None or positions.right_shoulder is None:
+            self.pain_localization.toaster.show_warning("Epaule non détectée, veuillez réessayer.")
+            return
+        if positions.marker is None:
+            self.pain_localization.toaster.show_warning("Dispositif non détecté, veuillez réessayer.")
+            return
+
+        self.calibration_positions.append(positions)
+        if len(self.calibration_positions) < len(CALIBRATION_LANDMARKS):
+            self.set_calibration_label()
+            return
+
+        positions, self.calibration_positions = self.calibration_positions, []
+        self.calibrating = False
+        self.set_calibration_label()
+        try:
+            calibration = fit_calibration(
+                np.array([p.left_shoulder for p in positions]),
+                np.array([p.right_shoulder for p in positions]),
+                np.array([p.marker for p in positions]),
+                np.array([avatar_point for _, avatar_point in CALIBRATION_LANDMARKS]),
+            )
+        except ValueError as e:
+            logger.warning(f"Calibration failed: {e}")
+            self.pain_localization.toaster.show_warning("Calibration impossible, veuillez recommencer.")
+            return
+
+        self.pain_localization.patient_data[CALIBRATION_KEY] = calibration
+        logger.info(f"Patient calibration: {calibration.tolist()}")
+        self.pain_localization.toaster.show_sucess("Calibration enregistrée.")
+
+    def set_calibration_label(self):
+        """
+        Show the landmark on which the device must be held next
+        """
+        if not self.calibrating:
+            self.calibration_button.setText("Calibrer")
+            return
+        instruction, _ = CALIBRATION_LANDMARKS[len(self.calibration_positions)]
+        self.calibration_button.setText(f"Dispositif sur {instruction}")
+
     def update_image(self, image: QImage):
         """
         Updates the image in the label
@@ -180,6 +290,8 @@ class PainLocalizationGUI(QWidget):
             self.pain_localization.tab_widget.setCurrentIndex(3)  # Switch to the next tab (Palpation)
 
     def timer_clicked(self):
+        # ! Restarting the timer cancels the analysis in progress
+        self.cancel_pick_job()
         self.timer.start(1000)
         self.timer_update_label.start(100)  # Update label every 100ms
         print("Timer button clicked.")
@@ -193,69 +305,89 @@ class PainLocalizationGUI(QWidget):
             self.timer_update_label.stop()
 
     def timer_timeout(self):
+        with metrics.timer("gui.timer_timeout"):
+            self.start_pick_job()
+
+    def start_pick_job(self):
+        """
+        Check the last positions and start the analysis of the captured frame
+        """
         print("Timer finished.")
         self.timer_button.setText("Lancer un timer")
         self.timer_update_label.stop()
         self.timer.stop()
 
+        # ! Use the last smoothed positions and the frame they were computed on (no new inference)
+        captured_image, positions = self.pain_localization.logic.get_positions()
+        if captured_image is None:
+            self.pain_localization.toaster.show_warning("Aucune image capturée, veuillez réessayer.")
+            return
 
-        # ! Show the captured image
-        captured_image = self.pain_localization.logic.frame.copy()
-        self.saved_image = captured_image.copy()  # Save the captured image for dictionary
-        if captured_image is not None:
-            left_shoulder, right_shoulder = self.pain_localization.logic.detect_shoulders(captured_image)
-            if left_shoulder is not None and right_shoulder is not None:
-                self.left_shoulder_coord = tuple(left_shoulder)
-                self.right_shoulder_coord = tuple(right_shoulder)
-                # Draw shoulders on the captured image
-                cv2.circle(captured_image, self.left_shoulder_coord, 15, (0, 0, 255), -1)  # Draw left shoulder
-                cv2.circle(captured_image, self.right_shoulder_coord, 15, (0, 0, 255), -1)  # Draw right shoulder
-            else:
-                self.pain_localization.toaster.show_warning("Epaule non détectée, veuillez réessayer.")
-                return
-
-            # Detect marker
-            marker_coord = self.pain_localization.logic.detect_marker(captured_image, left_shoulder, right_shoulder)
-            if marker_coord is not None:
-                self.marker_coord = tuple(marker_coord)
-                # Draw marker on the captured image
-                cv2.circle(captured_image, self.marker_coord, 10, (255, 0, 0), -1)  # Draw marker
-            else:
-                self.pain_localization.toaster.show_warning("Dispositif non détecté, veuillez réessayer.")
-                return
-
-
-            # call tool
-            avg_shoulder_y = (self.left_shoulder_coord[1] + self.right_shoulder_coord[1]) / 2
-            device_x,device_y = self.marker_coord
-            y_on_static_img = int(100 + (device_y - avg_shoulder_y))
-            min_x = min(self.left_shoulder_coord[0], self.right_shoulder_coord[0])
-            max_x = max(self.left_shoulder_coord[0], self.right_shoulder_coord[0])
-            percent = ((device_x - min_x) / (max_x - min_x + 1e-6)) * 100
-            static_x_start = 100
-            static_x_end = 377
-            x_on_static_img = int(static_x_start + (percent / 100) * (static_x_end - static_x_start))
-            self.structures =send_pick_request(x_on_static_img,y_on_static_img)
-            # Rescale and Convert the drawned image to QImage
-            height, width, channel = captured_image.shape
-            bytes_per_line = channel * width
-            frame = cv2.cvtColor(captured_image, cv2.COLOR_BGR2RGB)
-            self.captured_frame = QImage(frame.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
-            scaled_img = self.captured_frame.scaled(
-                self.pain_localization.logic.size_capture[0],
-                self.pain_localization.logic.size_capture[1],
-                Qt.AspectRatioMode.KeepAspectRatio,
-            )
-
-            self.captured_image.setPixmap(QPixmap.fromImage(scaled_img))
+        if positions.left_shoulder is None or positions.right_shoulder is None:
+            self.pain_localization.toaster.show_warning("Epaule non détectée, veuillez réessayer.")
+            return
 
-            # ! Enable the OK button and set it to green
-            self.ok_button.setEnabled(True)
-            self.ok_button.setStyleSheet("background-color: green; color: white;")
-        else:
-            self.pain_localization.toaster.show_warning("Aucune image capturée, veuillez réessayer.")
+        if positions.marker is None:
+            self.pain_localization.toaster.show_warning("Dispositif non détecté, veuillez réessayer.")
             return
 
+        # ! Analyze and pick the structures in the thread pool, the GUI keeps running
+        self.pick_job_id += 1
+        calibration = patient_calibration(self.pain_localization.patient_data)
+        self.pick_job = PickJob(self.pick_job_id, captured_image, positions, calibration)
+        self.pick_job.signals.finished.connect(self.on_pick_finished)
+        self.pick_job.signals.failed.connect(self.on_pick_failed)
+        QThreadPool.globalInstance().start(self.pick_job)
+
+        self.timer_button.setText("Analyse en cours...")
+        self.ok_button.setEnabled(False)
+        self.ok_button.setStyleSheet("background-color: gray; color: white;")
+
+    def cancel_pick_job(self):
+        """
+        Cancel the analysis in progress, its result will be ignored
+        """
+        if self.pick_job is not None:
+            self.pick_job.cancel()
+            self.pick_job = None
+            self.timer_button.setText("Lancer un timer")
+
+    def on_pick_finished(self, job_id: int, captured_image: np.ndarray, structures: list[str]):
+        """
+        Result of the PickJob, called in the GUI thread
+        """
+        if job_id != self.pick_job_id or self.pick_job is None:
+            return  # Cancelled job
+        self.saved_image = self.pick_job.frame  # Save the captured image (without drawings) for dictionary
+        self.structures = structures
+        self.pick_job = None
+        self.timer_button.setText("Lancer un timer")
+
+        # Wrap the drawned image in a QImage (OpenCV BGR order, no conversion), the array must stay alive
+        height, width, channel = captured_image.shape
+        self.captured_bgr = captured_image
+        self.captured_frame = QImage(
+            self.captured_bgr.data, width, height, self.captured_bgr.strides[0], QImage.Format.Format_BGR888
+        )
+        scaled_img = self.captured_frame.scaled(
+            self.pain_localization.logic.size_capture[0],
+            self.pain_localization.logic.size_capture[1],
+            Qt.AspectRatioMode.KeepAspectRatio,
+        )
+
+        self.captured_image.setPixmap(QPixmap.fromImage(scaled_img))
+
+        # ! Enable the OK button and set it to green
+        self.ok_button.setEnabled(True)
+        self.ok_button.setStyleSheet("background-color: green; color: white;")
+
+    def on_pick_failed(self, job_id: int, message: str):
+        if job_id != self.pick_job_id or self.pick_job is None:
+            return  # Cancelled job
+        self.pick_job = None
+        self.timer_button.setText("Lancer un timer")
+        self.pain_localization.toaster.show_error(f"Analyse impossible : {message}")
+
     def __init_footer(self):
         pass
 
@@ -267,6 +399,79 @@ class PainLocalizationSignals(QObject):
 
     change_pixmap_signal = pyqtSignal(QImage)
     start_new_computation_pos = pyqtSignal()
+    models_ready = pyqtSignal()
+    models_failed = pyqtSignal(str)  # error message
+    capture_failed = pyqtSignal(str)  # error message
+
+
+class PickJobSignals(QObject):
+    """
+    Signals of the PickJob, received in the GUI thread
+    """
+
+    finished = pyqtSignal(int, object, list)  # job id, captured image with drawings, structures
+    failed = pyqtSignal(int, str)  # job id, error message
+
+
+class PickJob(QRunnable):
+    """
+    Capture-analyze-pick job, runs in the Qt thread pool
+
+    It draws the positions on the captured frame, maps the marker on the
+    static avatar and asks the atlas for the structures at this position.
+    """
+
+    def __init__(self, job_id: int, frame: cv2.Mat, positions: DetectionResult, calibration: np.ndarray | None = None):
+        """
+        :param calibration: avatar mapping calibration of the patient, the default one if None
+        """
+        super().__init__()
+        self.job_id: int = job_id
+        self.frame: cv2.Mat = frame
+        self.positions: DetectionResult = positions
+        self.calibration: np.ndarray | None = calibration
+        self.signals: PickJobSignals = PickJobSignals()
+        self.cancelled: threading.Event = threading.Event()
+
+    def cancel(self):
+        """
+        The request in progress can not be interrupted, but its result will not be emitted
+        """
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            with metrics.timer("pick.job"):
+                captured_image, structures = self.analyze()
+        except Exception as e:  # ? The job must always answer the GUI
+            logger.exception("Pick job failed")
+            if not self.cancelled.is_set():
+                self.signals.failed.emit(self.job_id, str(e))
+            return
+
+        if not self.cancelled.is_set():
+            self.signals.finished.emit(self.job_id, captured_image, structures)
+
+    def analyze(self) -> tuple[cv2.Mat, list[str]]:
+        left_shoulder_coord = tuple(self.positions.left_shoulder)
+        right_shoulder_coord = tuple(self.positions.right_shoulder)
+        marker_coord = tuple(self.positions.marker)
+
+        # Draw shoulders and marker on the captured image
+        captured_image = self.frame.copy()
+        cv2.circle(captured_image, left_shoulder_coord, 15, (0, 0, 255), -1)  # Draw left shoulder
+        cv2.circle(captured_image, right_shoulder_coord, 15, (0, 0, 255), -1)  # Draw right shoulder
+        cv2.circle(captured_image, marker_coord, 10, (255, 0, 0), -1)  # Draw marker
+
+        # ! Position of the marker on the static avatar view
+        x_on_static_img, y_on_static_img = map_to_avatar(
+            left_shoulder_coord, right_shoulder_coord, marker_coord, self.calibration
+        )
+
+        if self.cancelled.is_set():
+            return captured_image, []
+        structures = pick_structures(x_on_static_img, y_on_static_img)
+        return captured_image, structures
 
 
 class PainLocalizationLogic(QRunnable):
@@ -281,29 +486,49 @@ class PainLocalizationLogic(QRunnable):
         self.worker_frequency = worker_frequency
         self.worker_period = 1 / worker_frequency
         self.video_source = video_source
+        self.capture: VideoCaptureAsync = VideoCaptureAsync(video_source)
         self.stopped: EventClass = mp.Event()
 
-        self.frame: cv2.Mat = None
+        # ! Latest captured frame, shared with the compute thread
+        self.frames: FrameMailbox = FrameMailbox()
         self.size_capture: tuple[int, int] = (640, 480)
-
-        # ! MODELS
-        PATH_MODELS = "models"
-        self.yolo_keypoint_model = YOLO(f"{PATH_MODELS}/yolo11n-pose.pt")
-        self.yolo_segmentation_model = YOLO(f"{PATH_MODELS}/best.pt")
+        self.preview: PreviewRenderer = PreviewRenderer()
+
+        # ! MODELS (pose + segmentation), loaded in the background by the compute thread
+        self.engine: InferenceEngine = None
+        self.scheduler: InferenceScheduler | InferenceProcess = None
+        self.inference_process: InferenceProcess = None  # Only if the models run in a separate process
+        self.models_ready: threading.Event = threading.Event()
+        # ! Smooth the positions over time and reject the outliers
+        self.smoother: PositionSmoother = PositionSmoother(
+            min_confidence=inference_config.min_confidence,
+            max_jump=inference_config.max_jump,
+        )
 
         # ! Live position of the shoulders and marker
         # ! Used to show on the image
         self.count_frames: int = 0
+        self.count_processed_frames: int = 0
         self.left_shoulder_coord: tuple[int, int] = (0, 0)
         self.right_shoulder_coord: tuple[int, int] = (0, 0)
         self.marker_coord: tuple[int, int] = (0, 0)
 
+        # ! Last smoothed positions and the frame they were computed on
+        self.positions_lock: threading.Lock = threading.Lock()
+        self.positions_frame: cv2.Mat = None
+        self.positions: DetectionResult = DetectionResult(None, None, None)
+        self.positions_sequence: int = 0  # Sequence of the frame of the positions in the mailbox
+        self.positions_time: float = 0.0  # Monotonic time of the positions
+
         self.compute_thread: threading.Thread = threading.Thread(
             target=self.routine_compute_new_positions,
             daemon=True,
         )
         self.compute_thread.start()
 
+        global _live_logic
+        _live_logic = self
+
     def set_size_capture(self, size: tuple[int, int]):
         """
         Set the size of the capture
@@ -311,32 +536,51 @@ class PainLocalizationLogic(QRunnable):
         """
         self.size_capture = size
 
+    @property
+    def frame(self) -> cv2.Mat:
+        """
+        Latest captured frame (read only), None if no frame was captured yet
+        """
+        return self.frames.latest()[1]
+
     def run(self):
-        self.cap = cv2.VideoCapture(self.video_source)
+        # ! Frames are grabbed (and paced for video files) in the background
+        try:
+            self.capture = VideoCaptureAsync(self.video_source, buffer_size=1).start()
+        except RuntimeError as e:
+            logger.error(e)
+            self.signals.capture_failed.emit(str(e))
+            return
         self.count_frames = 0
 
-        while not self.stopped.wait(timeout=self.worker_period):
-            ret, frame = self.cap.read()
+        while not self.stopped.is_set():
+            ret, frame = self.capture.read(timeout=self.worker_period * 10)
             if not ret:
-                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                if not self.capture.is_running():
+                    logger.warning("The capture stopped")
+                    self.signals.capture_failed.emit(f"plus d'images de {self.video_source}")
+                    return
                 continue
 
-            self.frame = frame.copy()
+            # ! The published frame is never modified, the preview is drawn in its own buffers
+            self.frames.put(frame)
             self.count_frames += 1
-
-            # ! Draw shoulders and marker on the frame
-            cv2.circle(frame, self.left_shoulder_coord, 15, (0, 0, 255), -1)  # Draw left shoulder
-            cv2.circle(frame, self.right_shoulder_coord, 15, (0, 0, 255), -1)  # Draw right shoulder
-            cv2.circle(frame, self.marker_coord, 10, (255, 0, 0), -1)  # Draw marker
-
-            # ? Rescale and Convert the drawned image to QImage
-            height, width, channel = frame.shape
-            bytes_per_line = channel * width
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame = QImage(frame.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
-            scaled_img = frame.scaled(self.size_capture[0], self.size_capture[1], Qt.AspectRatioMode.KeepAspectRatio)
-
-            self.signals.change_pixmap_signal.emit(scaled_img)
+            metrics.tick("capture")
+
+            # ? Resize first, then draw shoulders and marker on the small BGR image
+            with metrics.timer("preview.render"):
+                preview, _ = self.preview.render(
+                    frame,
+                    self.size_capture,
+                    [
+                        (self.left_shoulder_coord, 15, (0, 0, 255)),  # Left shoulder
+                        (self.right_shoulder_coord, 15, (0, 0, 255)),  # Right shoulder
+                        (self.marker_coord, 10, (255, 0, 0)),  # Marker
+                    ],
+                    metrics.hud_lines() if metrics.HUD_ENABLED else (),
+                )
+
+            self.signals.change_pixmap_signal.emit(preview)
 
     def detect_shoulders(self, raw_frame: cv2.Mat) -> tuple[np.ndarray, np.ndarray]:
         """
@@ -347,33 +591,7 @@ class PainLocalizationLogic(QRunnable):
         - The left shoulder coordinates
         - The right shoulder coordinates
         """
-        keypoints_results = self.yolo_keypoint_model(
-            source=raw_frame,
-            verbose=False,
-        )
-
-        if not keypoints_results:
-            logger.warning("No keypoints detected.")
-            return None, None
-
-        for result in keypoints_results:
-            if hasattr(result, "keypoints"):
-                keypoints = result.keypoints
-
-                if keypoints is not None and keypoints.shape[0] > 0:
-                    keypoints_numpy = keypoints.data.cpu().numpy()[0]
-
-                    left_shoulder = keypoints_numpy[5][:2]
-                    right_shoulder = keypoints_numpy[6][:2]
-
-                    # cv2.circle(raw_frame, tuple(left_shoulder.astype(int)), 15, (0, 0, 255), -1)
-                    # cv2.circle(raw_frame, tuple(right_shoulder.astype(int)), 15, (0, 0, 255), -1)
-
-            else:
-                logger.warning("No keypoints found in the results.")
-                return None, None
-
-        return left_shoulder.astype(int), right_shoulder.astype(int)
+        return self.engine.detect_shoulders(raw_frame)
 
     def detect_marker(self, raw_frame: cv2.Mat, left_shoulder: np.ndarray, right_shoulder: np.ndarray) -> np.ndarray:
         """
@@ -382,76 +600,112 @@ class PainLocalizationLogic(QRunnable):
 
         It will then return the marker on the frame as coordinates:
         """
-        seg_results = self.yolo_segmentation_model(source=raw_frame, verbose=False)
-
-        if not seg_results:
-            logger.warning("No segmentation results found.")
-            return None
-
-        last_device_location = None
+        return self.engine.detect_marker(raw_frame, left_shoulder, right_shoulder)
 
-        for result in seg_results:
-            masks = getattr(result, "masks", None)
-            boxes = getattr(result, "boxes", None)
+    def get_positions(self) -> tuple[cv2.Mat, DetectionResult]:
+        """
+        Last smoothed positions, with the frame they were computed on
+        The frame must not be modified, copy it first
+        :return: tuple of (frame or None if nothing was processed yet, positions)
+        """
+        with self.positions_lock:
+            return self.positions_frame, self.positions
 
-            if masks is not None and masks.data is not None and boxes is not None:
-                classes = boxes.cls
-                for i, mask in enumerate(masks.data):
-                    cls_id = int(classes[i].item())
-                    if cls_id == 2:  # Assuming class 2 is your "device"
-                        mask_np = mask.cpu().numpy().astype(np.uint8)
-                        ys, xs = np.where(mask_np > 0)
-                        if len(xs) == 0:
-                            continue
+    def get_tracking(self) -> tuple[int, float, DetectionResult]:
+        """
+        Last smoothed positions, to follow the live tracking stream from another thread
+        :return: tuple of (sequence of the frame, 0 if nothing was processed yet, monotonic time, positions)
+        """
+        with self.positions_lock:
+            return self.positions_sequence, self.positions_time, self.positions
 
-                        median_x = np.median(xs)
-                        median_y = np.median(ys)
+    def load_models(self):
+        """
+        Load the models and run a first inference on a blank frame, so that the lazy
+        initializations (imports, export, runtime setup) are done before the first real frame
+        """
+        start = time.perf_counter()
 
-                        # ? Weird reshape, idk why
-                        mask_h, mask_w = mask_np.shape
-                        frame_h, frame_w = raw_frame.shape[:2]
-                        median_x = int(median_x * frame_w / mask_w)
-                        median_y = int(median_y * frame_h / mask_h)
+        # ? The child process loads the models and runs the scheduler, the frames go through shared memory
+        if inference_config.inference_process:
+            self.inference_process = InferenceProcess().start()
+            self.scheduler = self.inference_process
+            logger.info(f"Models ready in a separate process in {time.perf_counter() - start:.1f}s")
+            return
 
-                        last_device_location = (median_x, median_y)
-            else:
-                # logger.warning("No masks or boxes found in the segmentation results.")
-                return None
+        # ! MODELS (pose + segmentation, run together on each frame)
+        engine = InferenceEngine.from_config()
+        engine.infer(np.zeros((480, 640, 3), dtype=np.uint8))
 
-        if last_device_location is not None:
-            return np.array([int(last_device_location[0]), int(last_device_location[1])])
-        return None
+        # ! Only run the models on keyframes, track the positions in between
+        self.scheduler = InferenceScheduler(
+            engine,
+            keyframe_interval=inference_config.keyframe_interval,
+            motion_threshold=inference_config.motion_threshold,
+        )
+        self.engine = engine
+        logger.info(f"Models ready in {time.perf_counter() - start:.1f}s")
 
     def routine_compute_new_positions(self):
         """
         This routine runs in a separate thread to compute the new positions of the shoulders and marker
-        It will use the self.frame, make a copy to avoid changes
+        It first loads the models (the GUI does not wait for them), then it waits for a new frame
+        in the mailbox, always takes the newest one (stale frames are dropped)
         and compute new positions of the shoulders and marker
 
+        Both models run in a single pass of the inference engine on keyframes,
+        the positions are tracked on the other frames
         """
+        try:
+            self.load_models()
+        except Exception as e:  # ? The GUI must leave the loading state whatever happens
+            logger.exception("Loading of the models failed")
+            self.signals.models_failed.emit(str(e))
+            return
+        self.models_ready.set()
+        self.signals.models_ready.emit()
 
-        while not self.stopped.is_set():
-            if self.count_frames % 1 == 0:
-                # Get the current frame
-                if self.frame is not None:
-                    copy_frame = self.frame.copy()
-
-                    # logger.debug(f"Processing frame shape {copy_frame.shape} at frame count {self.count_frames}")
-
-                    # Detect shoulders
-                    left_shoulder, right_shoulder = self.detect_shoulders(copy_frame)
-                    if left_shoulder is not None and right_shoulder is not None:
-                        self.left_shoulder_coord = tuple(left_shoulder)
-                        self.right_shoulder_coord = tuple(right_shoulder)
+        last_sequence = 0
 
-                    # Detect marker
-                    marker_coord = self.detect_marker(copy_frame, left_shoulder, right_shoulder)
-                    if marker_coord is not None:
-                        self.marker_coord = tuple(marker_coord)
+        while not self.stopped.is_set():
+            # Block until a new frame is captured, the timeout only lets us check for stop
+            sequence, frame = self.frames.wait_newer(last_sequence, timeout=0.5)
+            if frame is None:
+                continue
 
-            self.count_frames += 1
+            dropped_frames = sequence - last_sequence - 1
+            if last_sequence and dropped_frames > 0:
+                logger.trace(f"Dropped {dropped_frames} stale frames")
+                metrics.count("compute.dropped_frames", dropped_frames)
+            last_sequence = sequence
+
+            # Detect (or track) shoulders and marker, then smooth them
+            with metrics.timer("compute.frame"):
+                result = self.scheduler.process(frame)
+                timestamp = time.monotonic()
+                positions = self.smoother.update(result, timestamp)
+            metrics.tick("compute")
+            with self.positions_lock:
+                self.positions_frame = frame
+                self.positions = positions
+                self.positions_sequence = sequence
+                self.positions_time = timestamp
+
+            if positions.left_shoulder is not None and positions.right_shoulder is not None:
+                self.left_shoulder_coord = tuple(positions.left_shoulder)
+                self.right_shoulder_coord = tuple(positions.right_shoulder)
+
+            if positions.marker is not None:
+                self.marker_coord = tuple(positions.marker)
+
+            self.count_processed_frames += 1
 
     def stop(self):
         self.stopped.set()
-        self.cap.release()
+        self.frames.close()
+        self.capture.release()
+        if self.engine is not None:
+            self.engine.close()
+        if self.inference_process is not None:
+            self.inference_process.close()
         # self.captured_image = QLabel("Captured Image", self)
@@ -1,11 +1,16 @@
 import multiprocessing as mp
+import threading
+import time
 from multiprocessing.synchronize import Event as EventClass
 
 from loguru import logger
-from PyQt6.QtCore import QRunnable, Qt
+from PyQt6.QtCore import QRunnable, Qt, QTimer
 from PyQt6.QtWidgets import QHBoxLayout, QLabel, QPushButton, QSizePolicy, QVBoxLayout, QWidget
 
+from avatar_mapping import patient_calibration
+from pain_localization import get_live_logic
 from toaster import Toaster
+from trajectory import Trajectory, TrajectoryBuffer
 
 
 class Palpation:
@@ -25,6 +30,16 @@ class Palpation:
         self.gui: PalpationGUI = PalpationGUI(self)
         self.logic: PalpationLogic = PalpationLogic(self, worker_frequency=30)
 
+        # ! The trajectory is recorded from the moment the palpation step is entered
+        self.tab_widget.currentChanged.connect(self.on_current_tab_changed)
+        # ? The tab is built when it becomes current, its GUI is only placed in the tab after this constructor
+        QTimer.singleShot(0, lambda: self.on_current_tab_changed(self.tab_widget.currentIndex()))
+
+    def on_current_tab_changed(self, index: int) -> None:
+        tab = self.tab_widget.widget(index)
+        if tab is not None and tab.isAncestorOf(self.gui):
+            self.logic.start_recording()
+
 
 class PalpationGUI(QWidget):
     """
@@ -89,6 +104,11 @@ class PalpationGUI(QWidget):
         # Get the current pain index from the pain_count
         pain_index = self.parent.patient_data.get("pain_count", 0)
 
+        # ! Save the trajectory of the palpation on the avatar view
+        trajectory = self.parent.logic.stop_recording(patient_calibration(self.parent.patient_data))
+        self.parent.patient_data[f"trajectory_{pain_index}"] = trajectory
+        logger.info(f"Palpation trajectory of pain {pain_index}: {len(trajectory.time)} samples")
+
         # Change the sub-label to indicate the next pain number (for the next pain type, if there is one)
         self.sub_label.setText(f"Douleur n°{pain_index + 2}")
 
@@ -113,9 +133,49 @@ class PalpationLogic(QRunnable):
 
         self.stopped: EventClass = mp.Event()
 
+        # ! Trajectory of the palpation, from the live tracking of the pain localization
+        self.trajectory: TrajectoryBuffer = TrajectoryBuffer()
+        self.recording: threading.Event = threading.Event()
+        self.recording_start: float = 0.0
+
+    def start_recording(self) -> None:
+        """
+        Start a new trajectory, the previous one is discarded
+        Does nothing if a recording is running, it is only stopped by stop_recording
+        """
+        if self.recording.is_set():
+            return
+        if get_live_logic() is None:
+            logger.warning("No live tracking, the palpation trajectory will be empty")
+        self.trajectory.clear()
+        self.recording_start = time.monotonic()
+        self.recording.set()
+
+    def stop_recording(self, calibration=None) -> Trajectory:
+        """
+        Stop the recording
+        :param calibration: avatar mapping calibration of the patient, the default one if None
+        :return: trajectory on the avatar view
+        """
+        self.recording.clear()
+        return self.trajectory.to_trajectory(calibration)
+
     def run(self) -> None:
+        last_sequence = 0
         while not self.stopped.wait(timeout=self.worker_period):
-            logger.debug(f"Running Palpation logic at {self.worker_frequency} Hz")
+            live_logic = get_live_logic()
+            if not self.recording.is_set() or live_logic is None:
+                continue
+
+            # ? Only the frames processed since the last poll, and since the start of the recording
+            sequence, timestamp, positions = live_logic.get_tracking()
+            if sequence == last_sequence or timestamp < self.recording_start:
+                continue
+            last_sequence = sequence
+
+            if positions.left_shoulder is None or positions.right_shoulder is None or positions.marker is None:
+                continue
+            self.trajectory.append(timestamp, positions.left_shoulder, positions.right_shoulder, positions.marker)
 
     def stop(self) -> None:
         self.stopped.set()
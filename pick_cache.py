@@ -0,0 +1,124 @@
+"""
+Persistent cache of the atlas pick responses
+
+The pick space is only the 500x500 avatar view and the part list never
+changes, so the same requests come back over and over. The responses are
+stored in a SQLite database, keyed by:
+- The hash of the request (part list and view), so a new part list does not reuse old answers
+- The pick position quantized on a grid of `grid` pixels
+
+Entries expire after `ttl` seconds, and the least recently used ones are
+evicted when there are more than `max_entries`.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class PickCache:
+    def __init__(
+        self,
+        path: str,
+        namespace: str,
+        grid: int = 1,
+        ttl: float = 30 * 24 * 3600,
+        max_entries: int = 100_000,
+    ):
+        """
+        :param path: path of the SQLite database
+        :param namespace: hash of the request payload without the pick position
+        :param grid: size of the quantization cells in pixels, 1 keeps the exact position
+        :param ttl: lifetime of an entry in seconds
+        :param max_entries: number of entries kept, the least recently used are evicted
+        """
+        self.path: str = path
+        self.namespace: str = namespace
+        self.grid: int = max(1, grid)
+        self.ttl: float = ttl
+        self.max_entries: int = max_entries
+
+        self.count_hits: int = 0
+        self.count_misses: int = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock: threading.Lock = threading.Lock()
+        self._connection: sqlite3.Connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pick (
+                namespace TEXT NOT NULL,
+                cell_x INTEGER NOT NULL,
+                cell_y INTEGER NOT NULL,
+                parts TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                used_at REAL NOT NULL,
+                PRIMARY KEY (namespace, cell_x, cell_y)
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS pick_used_at ON pick (used_at)")
+        self._connection.commit()
+
+    def cell(self, x: int, y: int) -> tuple[int, int]:
+        """
+        Quantized cell of a pick position
+        """
+        return int(x) // self.grid, int(y) // self.grid
+
+    def cell_center(self, cell: tuple[int, int]) -> tuple[int, int]:
+        """
+        Position actually requested for a cell, so that every position of the cell gets the same answer
+        """
+        return cell[0] * self.grid + self.grid // 2, cell[1] * self.grid + self.grid // 2
+
+    def get(self, cell: tuple[int, int]) -> list[str] | None:
+        """
+        Cached structures of the cell, None if not cached or expired
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT parts, created_at FROM pick WHERE namespace = ? AND cell_x = ? AND cell_y = ?",
+                (self.namespace, *cell),
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl:
+                self.count_misses += 1
+                return None
+
+            self._connection.execute(
+                "UPDATE pick SET used_at = ? WHERE namespace = ? AND cell_x = ? AND cell_y = ?",
+                (now, self.namespace, *cell),
+            )
+            self._connection.commit()
+            self.count_hits += 1
+            return json.loads(row[0])
+
+    def put(self, cell: tuple[int, int], parts: list[str]):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO pick VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, *cell, json.dumps(parts), now, now),
+            )
+            self._evict(now)
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM pick")
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self, now: float):
+        self._connection.execute("DELETE FROM pick WHERE created_at < ?", (now - self.ttl,))
+        self._connection.execute(
+            "DELETE FROM pick WHERE rowid IN (SELECT rowid FROM pick ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
@@ -0,0 +1,71 @@
+"""
+Live preview of the capture
+
+The capture frames are much bigger than the preview label, so the frame is
+resized first, directly into a preallocated buffer at the label size, and the
+positions are drawn on the small image. The buffer is wrapped in a QImage with
+the BGR888 format of OpenCV, without any color conversion.
+
+The image is sent to the GUI thread through a queued signal, it must own its
+pixels: the buffer is copied once, at the label size, so the next frame can be
+rendered in the same buffer while the GUI thread shows the previous one.
+"""
+
+import cv2
+import numpy as np
+from PyQt6.QtGui import QImage
+
+
+class PreviewRenderer:
+    """
+    Renders the frames at the preview size, reusing the same buffer for every frame
+    """
+
+    def __init__(self):
+        self._buffer: np.ndarray | None = None
+
+    def render(
+        self,
+        frame: cv2.Mat,
+        size: tuple[int, int],
+        points: list[tuple[tuple[int, int], int, tuple[int, int, int]]] = (),
+        lines: list[str] = (),
+    ) -> tuple[QImage, float]:
+        """
+        Resize the frame to fit in size (keeping the aspect ratio) and draw the points on it
+        The frame is not modified
+        :param frame: BGR frame of the capture
+        :param size: tuple of (width, height) of the preview
+        :param points: list of (position in the frame, radius in the frame, BGR color)
+        :param lines: text drawn in the top left corner (HUD)
+        :return: tuple of (image owning its pixels, scale from the frame to the preview)
+        """
+        height, width = frame.shape[:2]
+        scale = min(max(size[0], 1) / width, max(size[1], 1) / height)
+        preview_width, preview_height = max(int(width * scale), 1), max(int(height * scale), 1)
+
+        buffer = self._next_buffer(preview_width, preview_height, frame.shape[2])
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        cv2.resize(frame, (preview_width, preview_height), dst=buffer, interpolation=interpolation)
+
+        for position, radius, color in points:
+            center = (int(position[0] * scale), int(position[1] * scale))
+            cv2.circle(buffer, center, max(int(radius * scale), 2), color, -1)
+
+        for index, line in enumerate(lines):
+            position = (8, 18 + 16 * index)
+            cv2.putText(buffer, line, position, cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 3, cv2.LINE_AA)
+            cv2.putText(buffer, line, position, cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1, cv2.LINE_AA)
+
+        # ? copy(): the image outlives this call (queued signal), it must not reference the reused buffer
+        image = QImage(buffer.data, preview_width, preview_height, buffer.strides[0], QImage.Format.Format_BGR888)
+        return image.copy(), scale
+
+    def _next_buffer(self, width: int, height: int, channels: int) -> np.ndarray:
+        """
+        Render buffer, only reallocated when the preview size changes
+        """
+        shape = (height, width, channels)
+        if self._buffer is None or self._buffer.shape != shape:
+            self._buffer = np.empty(shape, dtype=np.uint8)
+        return self._buffer
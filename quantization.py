@@ -0,0 +1,290 @@
+"""
+INT8 quantization of the pose and device segmentation models, and its benchmark
+
+The FP32 ONNX / OpenVINO graphs (see inference_backend.py) are quantized with a
+static calibration on frames sampled from the video, preprocessed exactly like
+ultralytics does at inference (letterbox to a square, RGB, 0-1):
+
+    python quantization.py quantize --backend onnx --frames 200
+    python quantization.py quantize --backend openvino --frames 200
+
+The benchmark runs every variant on other frames of the same video and reports,
+versus the PyTorch FP32 reference:
+- The latency of each model (median and 95th percentile)
+- The shoulder keypoints error and the marker position error, in camera pixels
+- How often the variant detects the same elements as the reference
+
+    python quantization.py benchmark --variants pytorch onnx onnx_int8 openvino openvino_int8
+
+Extra packages: onnx and onnxruntime for ONNX, openvino and nncf for OpenVINO.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+from loguru import logger
+
+import inference_config
+import video_source
+from capture import read_frame_range, video_properties
+from inference_backend import (
+    BACKENDS,
+    ONNX,
+    ONNX_INT8,
+    OPENVINO,
+    OPENVINO_INT8,
+    PYTORCH,
+    QUANTIZATION_PACKAGES,
+    QUANTIZED_BACKENDS,
+    export_model,
+    exported_model_path,
+    is_backend_available,
+    is_quantization_available,
+)
+from inference_engine import KEYPOINT_MODEL_PATH, SEGMENTATION_MODEL_PATH, InferenceEngine, model_input_size
+
+MODEL_PATHS = (KEYPOINT_MODEL_PATH, SEGMENTATION_MODEL_PATH)
+
+# The calibration frames are taken before this point of the video, the benchmark frames after
+CALIBRATION_SPLIT = 0.7
+
+# Padding color of the ultralytics letterbox
+LETTERBOX_COLOR = (114, 114, 114)
+
+
+def sample_frames(video_path: str, count: int, start: float = 0.0, end: float = 1.0) -> list[np.ndarray]:
+    """
+    Frames evenly spread over a part of the video
+    :param count: number of frames
+    :param start: beginning of the part, relative to the video length (0-1)
+    :param end: end of the part, relative to the video length (0-1)
+    """
+    try:
+        total, _ = video_properties(video_path)
+    except RuntimeError as e:
+        raise ValueError(f"Can not read the frames of {video_path}") from e
+    if total <= 0:
+        raise ValueError(f"Can not read the frames of {video_path}")
+
+    first, last = int(start * total), max(int(start * total), int(end * total) - 1)
+    # ? Read in order and keep the sampled frames, seeking to each of them is not frame accurate
+    sampled = set(np.linspace(first, last, count).astype(int).tolist())
+    frames = [frame for index, frame in read_frame_range(video_path, first, last + 1) if index in sampled]
+
+    logger.info(f"Sampled {len(frames)} frames from {video_path}")
+    return frames
+
+
+def letterbox(frame: np.ndarray, imgsz: int) -> np.ndarray:
+    """
+    Model input tensor of a frame, as prepared by ultralytics: resized to fit in a
+    imgsz square, centered on a gray background, RGB, NCHW, float32 in 0-1
+    """
+    height, width = frame.shape[:2]
+    scale = imgsz / max(height, width)
+    new_width, new_height = round(width * scale), round(height * scale)
+
+    square = np.full((imgsz, imgsz, 3), LETTERBOX_COLOR, dtype=np.uint8)
+    top, left = (imgsz - new_height) // 2, (imgsz - new_width) // 2
+    square[top : top + new_height, left : left + new_width] = cv2.resize(
+        frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR
+    )
+
+    tensor = square[:, :, ::-1].transpose(2, 0, 1)[np.newaxis]
+    return np.ascontiguousarray(tensor, dtype=np.float32) / 255.0
+
+
+def quantize_onnx(model_path: str, frames: list[np.ndarray], imgsz: int) -> str:
+    """
+    Static INT8 quantization (QDQ, per channel weights) of the ONNX graph of the model
+    :return: path of the quantized graph
+    """
+    # ? Optional packages, only needed to quantize for this backend
+    import onnx  # noqa: PLC0415
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static  # noqa: PLC0415
+
+    fp32_path = export_model(model_path, ONNX, imgsz)
+    int8_path = exported_model_path(model_path, ONNX_INT8)
+    input_name = onnx.load(fp32_path, load_external_data=False).graph.input[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.frames = iter(frames)
+
+        def get_next(self):
+            frame = next(self.frames, None)
+            return None if frame is None else {input_name: letterbox(frame, imgsz)}
+
+    logger.info(f"Quantizing {fp32_path} on {len(frames)} frames")
+    quantize_static(
+        fp32_path,
+        int8_path,
+        FrameReader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+    # ? ultralytics reads the task, the class names and the keypoints shape from the graph metadata
+    fp32_model = onnx.load(fp32_path, load_external_data=False)
+    int8_model = onnx.load(int8_path)
+    onnx.helper.set_model_props(int8_model, {prop.key: prop.value for prop in fp32_model.metadata_props})
+    onnx.save(int8_model, int8_path)
+    return int8_path
+
+
+def quantize_openvino(model_path: str, frames: list[np.ndarray], imgsz: int) -> str:
+    """
+    Static INT8 quantization (NNCF post training) of the OpenVINO graph of the model
+    :return: path of the directory of the quantized graph
+    """
+    # ? Optional packages, only needed to quantize for this backend
+    import nncf  # noqa: PLC0415
+    import openvino as ov  # noqa: PLC0415
+
+    fp32_dir = export_model(model_path, OPENVINO, imgsz)
+    int8_dir = exported_model_path(model_path, OPENVINO_INT8)
+    xml_name = next(name for name in os.listdir(fp32_dir) if name.endswith(".xml"))
+
+    logger.info(f"Quantizing {fp32_dir} on {len(frames)} frames")
+    model = ov.Core().read_model(os.path.join(fp32_dir, xml_name))
+    dataset = nncf.Dataset(frames, lambda frame: letterbox(frame, imgsz))
+    quantized = nncf.quantize(model, dataset, preset=nncf.QuantizationPreset.MIXED, subset_size=len(frames))
+
+    os.makedirs(int8_dir, exist_ok=True)
+    ov.save_model(quantized, os.path.join(int8_dir, xml_name))
+    # ? ultralytics reads the task, the class names and the keypoints shape from this file
+    shutil.copy(os.path.join(fp32_dir, "metadata.yaml"), os.path.join(int8_dir, "metadata.yaml"))
+    return int8_dir
+
+
+QUANTIZERS = {ONNX_INT8: quantize_onnx, OPENVINO_INT8: quantize_openvino}
+
+
+def quantize(backend: str, frames: list[np.ndarray], imgsz: int) -> list[str]:
+    """
+    Quantize both models for the backend ("onnx" or "openvino")
+    :return: paths of the quantized models
+    :raises RuntimeError: if the packages of the quantization are not installed
+    """
+    quantized_backend = next(name for name, base in QUANTIZED_BACKENDS.items() if base == backend)
+    if not is_quantization_available(quantized_backend):
+        packages = " ".join(QUANTIZATION_PACKAGES[quantized_backend])
+        raise RuntimeError(f"The quantization for {backend} needs: {packages}")
+    return [QUANTIZERS[quantized_backend](model_path, frames, imgsz) for model_path in MODEL_PATHS]
+
+
+def benchmark(variants: list[str], frames: list[np.ndarray], imgsz: int) -> dict:
+    """
+    Latency and accuracy of each variant versus the PyTorch FP32 reference
+    The ROI and the tracking are disabled, so every variant runs the full models on every frame
+    :return: variant -> metrics (latencies in ms, errors in camera pixels)
+    """
+    reference = InferenceEngine(imgsz=imgsz, backend=PYTORCH)
+    references = [reference.infer(frame) for frame in frames]
+    reference.close()
+
+    report = {}
+    for variant in variants:
+        if not is_backend_available(variant):
+            logger.warning(f"Skipping {variant}: not installed")
+            continue
+        if variant in QUANTIZED_BACKENDS and not all(
+            os.path.exists(exported_model_path(path, variant)) for path in MODEL_PATHS
+        ):
+            logger.warning(f"Skipping {variant}: run the quantization first")
+            continue
+
+        engine = InferenceEngine(imgsz=imgsz, backend=variant)
+        report[variant] = _benchmark_engine(engine, frames, references)
+        engine.close()
+
+    return report
+
+
+def _benchmark_engine(engine: InferenceEngine, frames: list[np.ndarray], references: list) -> dict:
+    keypoint_times, segmentation_times = [], []
+    shoulder_errors, marker_errors = [], []
+    same_shoulders, same_marker = 0, 0
+
+    # ? The first pass of each model initializes the runtime, it is not measured
+    warm_up, _ = engine.preprocess(frames[0])
+    engine.yolo_keypoint_model(source=warm_up, imgsz=engine.imgsz, verbose=False)
+    engine.yolo_segmentation_model(source=warm_up, imgsz=engine.imgsz, verbose=False)
+
+    for frame, expected in zip(frames, references, strict=True):
+        resized, _ = engine.preprocess(frame)
+
+        start = time.perf_counter()
+        engine.yolo_keypoint_model(source=resized, imgsz=engine.imgsz, verbose=False)
+        keypoint_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        engine.yolo_segmentation_model(source=resized, imgsz=engine.imgsz, verbose=False)
+        segmentation_times.append(time.perf_counter() - start)
+
+        result = engine.infer(frame)
+
+        found, expected_found = result.left_shoulder is not None, expected.left_shoulder is not None
+        same_shoulders += found == expected_found
+        if found and expected_found:
+            shoulder_errors.append(np.linalg.norm(result.left_shoulder - expected.left_shoulder))
+            shoulder_errors.append(np.linalg.norm(result.right_shoulder - expected.right_shoulder))
+
+        found, expected_found = result.marker is not None, expected.marker is not None
+        same_marker += found == expected_found
+        if found and expected_found:
+            marker_errors.append(np.linalg.norm(result.marker - expected.marker))
+
+    return {
+        "keypoint_ms": _percentiles(keypoint_times, 1000),
+        "segmentation_ms": _percentiles(segmentation_times, 1000),
+        "shoulder_error_px": _percentiles(shoulder_errors),
+        "marker_error_px": _percentiles(marker_errors),
+        "shoulder_agreement": same_shoulders / len(frames),
+        "marker_agreement": same_marker / len(frames),
+    }
+
+
+def _percentiles(values: list[float], factor: float = 1.0) -> dict:
+    if not values:
+        return {"mean": None, "p50": None, "p95": None}
+    values = np.asarray(values) * factor
+    return {
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="INT8 quantization of the models and its benchmark")
+    parser.add_argument("--video", default=video_source.video_source, help="Video of the calibration and the benchmark")
+    parser.add_argument("--imgsz", type=int, default=inference_config.imgsz)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    quantize_parser = subparsers.add_parser("quantize", help="Build the INT8 models with a static calibration")
+    quantize_parser.add_argument("--backend", choices=list(QUANTIZED_BACKENDS.values()), default=ONNX)
+    quantize_parser.add_argument("--frames", type=int, default=200, help="Number of calibration frames")
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="Latency and accuracy versus the PyTorch FP32 reference")
+    benchmark_parser.add_argument("--variants", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    benchmark_parser.add_argument("--frames", type=int, default=100, help="Number of benchmark frames")
+
+    args = parser.parse_args()
+    imgsz = model_input_size(args.imgsz)
+
+    if args.command == "quantize":
+        frames = sample_frames(args.video, args.frames, end=CALIBRATION_SPLIT)
+        for path in quantize(args.backend, frames, imgsz):
+            print(f"Quantized model saved at {path}")
+    elif args.command == "benchmark":
+        # ? Held out part of the video, the models were not calibrated on these frames
+        frames = sample_frames(args.video, args.frames, start=CALIBRATION_SPLIT)
+        print(json.dumps(benchmark(args.variants, frames, imgsz), indent=2))
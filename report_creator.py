@@ -16,6 +16,8 @@ import shutil
 import cv2 as cv
 import typst
 
+from metrics import timer
+
 
 class ReportCreator:
     def __init__(
@@ -147,10 +149,11 @@ class ReportCreator:
             for line in self.content:
                 f.write(f"{line}\n")
 
-        typst.compile(
-            f"{self.report_temp_dir}/main.typ",
-            f"{self.report_output_pdf}",
-        )
+        with timer("report.compile"):
+            typst.compile(
+                f"{self.report_temp_dir}/main.typ",
+                f"{self.report_output_pdf}",
+            )
 
 
 if __name__ == "__main__":
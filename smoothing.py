@@ -0,0 +1,169 @@
+"""
+Temporal smoothing of the shoulders and marker positions
+
+Each point goes through:
+- A confidence gate: detections below `min_confidence` are ignored
+- An outlier rejection: jumps larger than `max_jump` times the shoulders width
+  are ignored, unless they persist for `max_outliers` frames (real movement)
+- A One-Euro filter: strong smoothing when the point is still, low lag when it moves
+
+Source : https://gery.casiez.net/1euro/
+"""
+
+import math
+import threading
+
+import numpy as np
+
+from inference_engine import DetectionResult
+
+POINT_NAMES = ("left_shoulder", "right_shoulder", "marker")
+
+
+class OneEuroFilter:
+    """
+    One-Euro filter on a point (x, y)
+    """
+
+    def __init__(self, min_cutoff: float = 1.0, beta: float = 0.05, d_cutoff: float = 1.0):
+        """
+        :param min_cutoff: cutoff frequency (Hz) when the point is still, lower is smoother
+        :param beta: how fast the cutoff increases with the speed, higher means less lag
+        :param d_cutoff: cutoff frequency (Hz) of the speed estimation
+        """
+        self.min_cutoff: float = min_cutoff
+        self.beta: float = beta
+        self.d_cutoff: float = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.value: np.ndarray = None
+        self.speed: np.ndarray = None
+        self.timestamp: float = None
+
+    @staticmethod
+    def _alpha(cutoff: float, period: float) -> float:
+        tau = 1 / (2 * math.pi * cutoff)
+        return 1 / (1 + tau / period)
+
+    def __call__(self, value: np.ndarray, timestamp: float) -> np.ndarray:
+        value = np.asarray(value, dtype=np.float64)
+        if self.value is None:
+            self.value, self.speed, self.timestamp = value, np.zeros_like(value), timestamp
+            return self.value
+
+        period = max(timestamp - self.timestamp, 1e-3)
+        speed = (value - self.value) / period
+        self.speed = self.speed + self._alpha(self.d_cutoff, period) * (speed - self.speed)
+
+        cutoff = self.min_cutoff + self.beta * float(np.linalg.norm(self.speed))
+        self.value = self.value + self._alpha(cutoff, period) * (value - self.value)
+        self.timestamp = timestamp
+        return self.value
+
+
+class PositionSmoother:
+    """
+    Filters the DetectionResult stream, one filter per point
+    """
+
+    def __init__(
+        self,
+        min_confidence: float = 0.5,
+        max_jump: float = 0.5,
+        max_outliers: int = 3,
+        max_age: float = 1.0,
+        min_cutoff: float = 1.0,
+        beta: float = 0.05,
+    ):
+        """
+        :param min_confidence: detections with a lower confidence are ignored
+        :param max_jump: largest accepted move between two frames, relative to the shoulders width
+        :param max_outliers: number of consecutive jumps after which the new position is accepted
+        :param max_age: seconds after which a point that was not updated is considered lost
+        :param min_cutoff: One-Euro filter cutoff when still
+        :param beta: One-Euro filter speed coefficient
+        """
+        self.min_confidence: float = min_confidence
+        self.max_jump: float = max_jump
+        self.max_outliers: int = max_outliers
+        self.max_age: float = max_age
+
+        self.filters: dict[str, OneEuroFilter] = {name: OneEuroFilter(min_cutoff, beta) for name in POINT_NAMES}
+        self.count_outliers: dict[str, int] = dict.fromkeys(POINT_NAMES, 0)
+        self.count_rejected: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            for name in POINT_NAMES:
+                self.filters[name].reset()
+                self.count_outliers[name] = 0
+
+    def update(self, result: DetectionResult, timestamp: float) -> DetectionResult:
+        """
+        Feed a new detection
+        :param result: raw positions from the scheduler
+        :param timestamp: time of the frame in seconds (monotonic)
+        :return: smoothed positions, None for the points that are unknown or lost
+        """
+        with self._lock:
+            shoulders_width = self._shoulders_width()
+            for name in POINT_NAMES:
+                point = getattr(result, name)
+                confidence = getattr(result, f"{name}_confidence")
+                if point is None or confidence < self.min_confidence:
+                    continue
+                if self._is_outlier(name, point, shoulders_width):
+                    self.count_rejected += 1
+                    continue
+                self.filters[name](point, timestamp)
+
+            return self._positions(timestamp)
+
+    def positions(self, timestamp: float) -> DetectionResult:
+        """
+        Current smoothed positions
+        :param timestamp: current time in seconds (monotonic), used to drop the lost points
+        """
+        with self._lock:
+            return self._positions(timestamp)
+
+    def _shoulders_width(self) -> float | None:
+        left, right = self.filters["left_shoulder"].value, self.filters["right_shoulder"].value
+        if left is None or right is None:
+            return None
+        return float(np.linalg.norm(left - right))
+
+    def _is_outlier(self, name: str, point: np.ndarray, shoulders_width: float | None) -> bool:
+        current = self.filters[name].value
+        if current is None or not shoulders_width:
+            return False
+
+        if np.linalg.norm(np.asarray(point) - current) <= self.max_jump * shoulders_width:
+            self.count_outliers[name] = 0
+            return False
+
+        # ? A jump that persists is a real movement, restart the filter on it
+        self.count_outliers[name] += 1
+        if self.count_outliers[name] >= self.max_outliers:
+            self.count_outliers[name] = 0
+            self.filters[name].reset()
+            return False
+        return True
+
+    def _positions(self, timestamp: float) -> DetectionResult:
+        points = {}
+        for name in POINT_NAMES:
+            point_filter = self.filters[name]
+            if point_filter.value is None or timestamp - point_filter.timestamp > self.max_age:
+                points[name] = None
+            else:
+                points[name] = np.rint(point_filter.value).astype(int)
+
+        return DetectionResult(
+            **points,
+            left_shoulder_confidence=1.0 if points["left_shoulder"] is not None else 0.0,
+            right_shoulder_confidence=1.0 if points["right_shoulder"] is not None else 0.0,
+            marker_confidence=1.0 if points["marker"] is not None else 0.0,
+        )
@@ -0,0 +1,139 @@
+"""
+Lazy registry of the application tabs
+
+Every tab is declared by the module and the class that build it, the module
+is only imported (and the tab built) the first time the tab is shown, so the
+heavy dependencies of a step (OpenCV, the models, typst, the atlas client...)
+do not slow down the start of the application.
+
+Each tab starts as an empty placeholder in the QTabWidget, so the indexes used
+by the tabs to navigate (tab_widget.setCurrentIndex) never change. When a tab
+is shown, the module of the next one is imported in a background thread so
+that the next step opens without waiting for its imports.
+"""
+
+import importlib
+import threading
+from typing import NamedTuple
+
+from loguru import logger
+from PyQt6.QtCore import QThreadPool
+from PyQt6.QtWidgets import QTabWidget, QVBoxLayout, QWidget
+
+
+class TabSpec(NamedTuple):
+    """
+    Declaration of a tab, the class is called with (patient_data, tab_widget, toaster)
+    and must expose the tab widget as `gui`
+    """
+
+    title: str
+    module: str
+    class_name: str
+    # Build the tab in the background of the start, instead of on its first visit
+    preload: bool = False
+    # The `logic` of the tab is a QRunnable started in the thread pool once built
+    start_logic: bool = False
+
+
+class LazyTabRegistry:
+    def __init__(
+        self,
+        tab_widget: QTabWidget,
+        specs: list[TabSpec],
+        tab_args: tuple,
+        threadpool: QThreadPool,
+        prefetch: bool = True,
+    ):
+        """
+        :param tab_widget: widget receiving the tabs, in the order of specs
+        :param specs: declarations of the tabs
+        :param tab_args: arguments given to the class of every tab
+        :param threadpool: thread pool where the logic of the tabs are started
+        :param prefetch: import the module of the next tab in the background when a tab is shown
+        """
+        self.tab_widget: QTabWidget = tab_widget
+        self.specs: list[TabSpec] = specs
+        self.tab_args: tuple = tab_args
+        self.threadpool: QThreadPool = threadpool
+        self.prefetch: bool = prefetch
+
+        self.tabs: dict[str, object] = {}  # Module name -> built tab
+        self.started_logics: list = []
+        self._placeholders: list[QWidget] = []
+
+    def install(self):
+        """
+        Add a placeholder for every tab and build the current one
+        """
+        for spec in self.specs:
+            placeholder = QWidget()
+            layout = QVBoxLayout(placeholder)
+            layout.setContentsMargins(0, 0, 0, 0)
+            self._placeholders.append(placeholder)
+            self.tab_widget.addTab(placeholder, spec.title)
+
+        self.tab_widget.currentChanged.connect(self.on_current_changed)
+        self.on_current_changed(self.tab_widget.currentIndex())
+
+    def preload(self):
+        """
+        Build the tabs declared with preload (call it once the window is shown)
+        """
+        for index, spec in enumerate(self.specs):
+            if spec.preload:
+                self.build(index)
+
+    def get(self, module: str) -> object | None:
+        """
+        Tab built from the module, None if it was not built yet
+        """
+        return self.tabs.get(module)
+
+    def on_current_changed(self, index: int):
+        if not 0 <= index < len(self.specs):
+            return
+        self.build(index)
+        if self.prefetch and index + 1 < len(self.specs):
+            self.prefetch_module(self.specs[index + 1].module)
+
+    def build(self, index: int) -> object:
+        """
+        Import the module of the tab and build it, only the first time
+        """
+        spec = self.specs[index]
+        if spec.module in self.tabs:
+            return self.tabs[spec.module]
+
+        logger.info(f"Building tab {spec.title!r}")
+        tab_class = getattr(importlib.import_module(spec.module), spec.class_name)
+        tab = tab_class(*self.tab_args)
+        self._placeholders[index].layout().addWidget(tab.gui)
+        self.tabs[spec.module] = tab
+
+        if spec.start_logic:
+            self.threadpool.start(tab.logic)
+            self.started_logics.append(tab.logic)
+        return tab
+
+    def prefetch_module(self, module: str):
+        """
+        Import the module in a background thread, the widgets are still built in the GUI thread
+        """
+        if module in self.tabs:
+            return
+
+        def import_module():
+            try:
+                importlib.import_module(module)
+            except Exception:  # ? The import is retried (and the error shown) when the tab is built
+                logger.exception(f"Prefetch of {module} failed")
+
+        threading.Thread(target=import_module, name=f"prefetch-{module}", daemon=True).start()
+
+    def stop(self):
+        """
+        Stop the logic of the tabs started in the thread pool
+        """
+        for logic in self.started_logics:
+            logic.stop()
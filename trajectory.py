@@ -0,0 +1,93 @@
+"""
+Recording of the palpation trajectory
+
+The positions of the live tracking are appended to a ring of preallocated NumPy
+arrays: the memory is bounded whatever the length of the palpation, the oldest
+samples are overwritten once the ring is full. The camera positions (shoulders
+and marker) are recorded, the whole trajectory is mapped on the avatar view at
+once when the recording stops.
+
+    buffer = TrajectoryBuffer()
+    buffer.append(timestamp, left_shoulder, right_shoulder, marker)  # Tracking thread
+    trajectory = buffer.to_trajectory(calibration)                   # Trajectory(time, avatar)
+"""
+
+import threading
+from typing import NamedTuple
+
+import numpy as np
+from loguru import logger
+
+from avatar_mapping import map_points_to_avatar
+
+# Samples kept in the ring, 10 minutes at 30 FPS
+TRAJECTORY_CAPACITY = 30 * 60 * 10
+
+
+class Trajectory(NamedTuple):
+    """
+    Palpation trajectory, in chronological order
+    """
+
+    time: np.ndarray  # (N,) float64 seconds since the first sample
+    avatar: np.ndarray  # (N, 2) float32 (x, y) pick coordinates on the avatar view
+
+
+class TrajectoryBuffer:
+    """
+    Fixed-size ring of the tracked positions, written by one thread and read by others
+    """
+
+    def __init__(self, capacity: int = TRAJECTORY_CAPACITY):
+        self.capacity: int = capacity
+        self._lock: threading.Lock = threading.Lock()
+        self._times: np.ndarray = np.empty(capacity, dtype=np.float64)
+        self._points: np.ndarray = np.empty((capacity, 3, 2), dtype=np.float32)  # Left shoulder, right shoulder, marker
+        self._next: int = 0  # Index of the next sample in the ring
+        self.count_samples: int = 0  # Since the last clear, overwritten samples included
+
+    def __len__(self) -> int:
+        return min(self.count_samples, self.capacity)
+
+    @property
+    def count_overwritten(self) -> int:
+        return max(0, self.count_samples - self.capacity)
+
+    def append(self, timestamp: float, left_shoulder: np.ndarray, right_shoulder: np.ndarray, marker: np.ndarray):
+        """
+        Record a sample, overwrites the oldest one if the ring is full
+        :param timestamp: monotonic time of the positions
+        """
+        with self._lock:
+            self._times[self._next] = timestamp
+            self._points[self._next] = (left_shoulder, right_shoulder, marker)
+            self._next = (self._next + 1) % self.capacity
+            self.count_samples += 1
+            if self.count_samples == self.capacity + 1:
+                logger.warning(f"Trajectory ring full ({self.capacity} samples), the oldest samples are overwritten")
+
+    def clear(self):
+        with self._lock:
+            self._next = 0
+            self.count_samples = 0
+
+    def samples(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Copy of the samples in chronological order
+        :return: tuple of (N,) timestamps, (N, 3, 2) left shoulder, right shoulder and marker positions
+        """
+        with self._lock:
+            if self.count_samples <= self.capacity:
+                return self._times[: self._next].copy(), self._points[: self._next].copy()
+            # ? The ring wrapped, the oldest sample is the next one to be overwritten
+            order = np.r_[self._next : self.capacity, 0 : self._next]
+            return self._times[order], self._points[order]
+
+    def to_trajectory(self, calibration: np.ndarray | None = None) -> Trajectory:
+        """
+        Trajectory of the samples on the avatar view, mapped in a single vectorized call
+        :param calibration: avatar mapping calibration of the patient, the default one if None
+        """
+        times, points = self.samples()
+        avatar = map_points_to_avatar(points[:, 0], points[:, 1], points[:, 2], calibration).astype(np.float32)
+        return Trajectory(times - times[0] if len(times) else times, avatar.reshape(-1, 2))